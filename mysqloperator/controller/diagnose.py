@@ -9,16 +9,55 @@ from .innodbcluster.cluster_api import InnoDBCluster, MySQLPod
 import typing
 from typing import Optional, TYPE_CHECKING, Tuple, List, Set, Dict, cast
 from . import shellutils, consts, errors
+from .gtid import GtidSet
+from .metrics import g_metrics
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 import kopf
 import mysqlsh
 import enum
+import json
+import threading
 import time
+import os
 if TYPE_CHECKING:
     from mysqlsh.mysql import ClassicSession
     from mysqlsh import Dba, Cluster
 
 mysql = mysqlsh.mysql
 
+# Connect timeout for each instance probed when diagnosing a cluster (milliseconds)
+k_diagnose_connect_timeout = int(os.getenv("MYSQL_OPERATOR_DIAGNOSE_CONNECT_TIMEOUT", default="5000"))
+
+# Time to wait for all instances of a cluster to be probed. Instances that
+# take longer are considered UNKNOWN (seconds)
+k_diagnose_timeout = int(os.getenv("MYSQL_OPERATOR_DIAGNOSE_TIMEOUT", default="30"))
+
+# Number of threads used to probe instances in parallel
+k_diagnose_workers = int(os.getenv("MYSQL_OPERATOR_DIAGNOSE_WORKERS", default="16"))
+
+# Probe instances with a single SQL query, using the AdminAPI only when the
+# result of the query is not conclusive
+k_diagnose_fast_probe = os.getenv("MYSQL_OPERATOR_DIAGNOSE_FAST_PROBE", default="1") == "1"
+
+# How long a cluster diagnosis can be reused for, unless it's invalidated
+# earlier by a group view change or a pod event (seconds)
+k_diagnosis_cache_ttl = float(os.getenv("MYSQL_OPERATOR_DIAGNOSIS_CACHE_TTL", default="5"))
+
+_diagnose_executor = ThreadPoolExecutor(max_workers=k_diagnose_workers,
+                                        thread_name_prefix="diagnose")
+
+_probes_abandoned = g_metrics.counter(
+    "mysql_operator_diagnose_probes_abandoned_total",
+    "Instance probes still running when the diagnosis timed out")
+_probes_running = g_metrics.gauge(
+    "mysql_operator_diagnose_probes_abandoned_running",
+    "Abandoned instance probes that haven't finished yet")
+
+# Probes that didn't finish in time and are still running, by pod. They can't
+# be interrupted, so no new probe of the same pod is started until they end.
+_abandoned_probes: Dict[Tuple[str, str], Future] = {}
+_abandoned_probes_lock = threading.Lock()
+
 #
 # InnoDB Cluster Instance Diagnostic Statuses
 #
@@ -63,7 +102,8 @@ class InstanceStatus:
     def __repr__(self) -> str:
         return f"InstanceStatus: pod={self.pod} status={self.status} connect_error={self.connect_error} view_id={self.view_id} is_primary={self.is_primary} in_quorum={self.in_quorum} peers={self.peers}"
 
-def diagnose_instance(pod: MySQLPod, logger, dba: 'Dba' = None) -> InstanceStatus:
+def diagnose_instance(pod: MySQLPod, logger, dba: 'Dba' = None,
+                      connect_timeout: Optional[int] = None) -> InstanceStatus:
     """
     Check state of an instance in the given pod.
 
@@ -76,8 +116,11 @@ def diagnose_instance(pod: MySQLPod, logger, dba: 'Dba' = None) -> InstanceStatu
     status.pod = pod
 
     if not dba:
+        co = pod.endpoint_co
+        if connect_timeout is not None:
+            co["connect-timeout"] = connect_timeout
         try:
-            dba = mysqlsh.connect_dba(pod.endpoint_co)
+            dba = shellutils.pooled_connect_dba(co)
         except mysqlsh.Error as e:
             logger.info(f"Could not connect to {pod.endpoint}: error={e}")
             status.connect_error = e.code
@@ -99,6 +142,15 @@ def diagnose_instance(pod: MySQLPod, logger, dba: 'Dba' = None) -> InstanceStatu
 
             return status
 
+        # give the session back to the pool when done
+        with shellutils.DbaWrap(dba):
+            return diagnose_instance(pod, logger, dba)
+
+    if dba and k_diagnose_fast_probe:
+        fast_status = probe_instance(pod, dba.session, logger)
+        if fast_status:
+            return fast_status
+
     cluster = None
     if dba:
         status.gtid_executed = dba.session.run_sql("select @@gtid_executed").fetch_one()[0]
@@ -181,6 +233,83 @@ def diagnose_instance(pod: MySQLPod, logger, dba: 'Dba' = None) -> InstanceStatu
     return status
 
 
+k_probe_instance_query = """SELECT @@server_uuid, @@gtid_executed,
+    (SELECT JSON_ARRAYAGG(JSON_OBJECT('id', member_id, 'state', member_state, 'role', member_role))
+        FROM performance_schema.replication_group_members),
+    (SELECT view_id FROM performance_schema.replication_group_member_stats
+        WHERE member_id = @@server_uuid),
+    (SELECT JSON_ARRAYAGG(JSON_OBJECT('id', i.mysql_server_uuid, 'address', i.address))
+        FROM mysql_innodb_cluster_metadata.instances i
+        WHERE i.cluster_id = (SELECT cluster_id FROM mysql_innodb_cluster_metadata.instances
+                                WHERE mysql_server_uuid = @@server_uuid))"""
+
+
+def probe_instance(pod: MySQLPod, session: 'ClassicSession', logger) -> Optional[InstanceStatus]:
+    """
+    Quick version of diagnose_instance(), that gets the GR state, GTID set and
+    the local copy of the metadata in a single query instead of going through
+    the AdminAPI.
+
+    Returns None if the result is not conclusive (e.g. the instance is not in
+    the metadata, is in ERROR or is in the group with an instance that's not
+    in the metadata), in which case the full diagnosis must be done.
+    """
+    try:
+        row = session.run_sql(k_probe_instance_query).fetch_one()
+    except mysqlsh.Error as e:
+        if e.code not in (mysql.ErrorCode.ER_BAD_DB_ERROR, mysql.ErrorCode.ER_NO_SUCH_TABLE):
+            logger.info(f"Fast probe of {pod.endpoint} failed: error={e}")
+        return None
+
+    server_uuid, gtid_executed, group_members, view_id, md_instances = row
+    group_members = json.loads(group_members) if group_members else []
+    md_instances = json.loads(md_instances) if md_instances else []
+
+    if not md_instances:
+        # not in the metadata: NOT_MANAGED or UNMANAGED
+        return None
+
+    status = InstanceStatus()
+    status.pod = pod
+    status.gtid_executed = gtid_executed
+
+    members = {m["id"]: m for m in group_members if m["id"]}
+    me = members.get(server_uuid)
+    if not me or me["state"] == "OFFLINE":
+        # GR is not running, but the instance is in the metadata
+        status.status = InstanceDiagStatus.OFFLINE
+        return status
+
+    if me["state"] not in ("ONLINE", "RECOVERING"):
+        return None
+
+    addresses = {i["id"]: i["address"] for i in md_instances}
+    if set(members.keys()) - set(addresses.keys()):
+        return None
+    if addresses[server_uuid] != pod.endpoint:
+        return None
+
+    status.peers = {}
+    for member_id, address in addresses.items():
+        member = members.get(member_id)
+        status.peers[address] = member["state"] if member else "(MISSING)"
+
+    reachable = [m for m in members.values() if m["state"] != "UNREACHABLE"]
+    status.in_quorum = len(reachable) > len(members) / 2
+    if not status.in_quorum:
+        logger.info(
+            f"""No quorum visible from {pod.endpoint}: topology={";".join([f'{a},{s}' for a, s in status.peers.items()])}""")
+
+    status.view_id = view_id
+    if me["state"] == "ONLINE":
+        status.status = InstanceDiagStatus.ONLINE
+        status.is_primary = me["role"] == "PRIMARY"
+    else:
+        status.status = InstanceDiagStatus.RECOVERING
+
+    return status
+
+
 #
 # InnoDB Cluster Candidate Instance Statuses
 #
@@ -215,21 +344,28 @@ class CandidateStatus:
     bad_gtid_set: Optional[str] = None
 
 
-def check_errant_gtids(primary_session: 'ClassicSession', pod: MySQLPod, pod_dba: 'Dba', logger) -> Optional[str]:
-    try:
-        gtid_set = pod_dba.session.run_sql(
-            "SELECT @@globals.GTID_EXECUTED").fetch_one()[0]
-    except mysqlsh.Error as e:
-        if e.code == mysql.ErrorCode.ER_UNKNOWN_SYSTEM_VARIABLE:
-            return None
-        else:
-            raise
+def check_errant_gtids(primary_session: 'ClassicSession', pod: MySQLPod, pod_dba: 'Dba', logger,
+                       gtid_set: Optional[str] = None) -> Optional[str]:
+    """
+    Return the transactions of the pod that are missing in the PRIMARY, if
+    any. gtid_set is the @@gtid_executed of the pod, if already known.
+    """
+    if gtid_set is None:
+        try:
+            gtid_set = pod_dba.session.run_sql(
+                "SELECT @@globals.GTID_EXECUTED").fetch_one()[0]
+        except mysqlsh.Error as e:
+            if e.code == mysql.ErrorCode.ER_UNKNOWN_SYSTEM_VARIABLE:
+                return None
+            else:
+                raise
 
     if gtid_set:
         # find primary
-        errants = primary_session.run_sql(
-            "SELECT GTID_SUBTRACT(?, @@globals.GTID_EXECUTED)", [gtid_set]).fetch_one()[0]
-        return errants
+        primary_gtid_set = primary_session.run_sql(
+            "SELECT @@globals.GTID_EXECUTED").fetch_one()[0]
+        errants = GtidSet.parse(gtid_set) - GtidSet.parse(primary_gtid_set)
+        return str(errants)
     return None
 
 
@@ -251,7 +387,7 @@ def diagnose_cluster_candidate(primary_session: 'ClassicSession', cluster: 'Clus
         logger.debug(f"{pod} is {istatus.status} -> {status.status}")
     elif istatus.status in (InstanceDiagStatus.NOT_MANAGED, InstanceDiagStatus.UNMANAGED):
         status.bad_gtid_set = check_errant_gtids(
-            primary_session, pod, pod_dba, logger)
+            primary_session, pod, pod_dba, logger, istatus.gtid_executed)
         if status.bad_gtid_set:
             logger.warning(
                 f"{pod} has errant transactions relative to the cluster: errant_gtids={status.bad_gtid_set}")
@@ -271,7 +407,7 @@ def diagnose_cluster_candidate(primary_session: 'ClassicSession', cluster: 'Clus
             fatal_error = None
 
         status.bad_gtid_set = check_errant_gtids(
-            primary_session, pod, pod_dba, logger)
+            primary_session, pod, pod_dba, logger, istatus.gtid_executed)
         if status.bad_gtid_set:
             logger.warning(
                 f"{pod} has errant transactions relative to the cluster: errant_gtids={status.bad_gtid_set}")
@@ -440,6 +576,117 @@ class ClusterStatus:
     online_members: List[MySQLPod] = []
     quorum_candidates: Optional[list] = None
     gtid_executed: Dict[int,str] = {}
+    view_id: Optional[str] = None
+
+
+class DiagnosisCache:
+    """
+    Recent cluster diagnoses, keyed by cluster UID, so that handlers reacting
+    to the same event share one diagnosis instead of running one each.
+
+    Entries expire after a short TTL and are invalidated explicitly when the
+    cluster changes (group view changes, pod events and operator actions).
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Tuple[float, ClusterStatus]] = {}
+
+    def get(self, cluster_uid: str) -> Optional[ClusterStatus]:
+        with self.lock:
+            entry = self.entries.get(cluster_uid)
+            if entry:
+                timestamp, status = entry
+                if time.monotonic() - timestamp < self.ttl:
+                    return status
+                del self.entries[cluster_uid]
+        return None
+
+    def put(self, cluster_uid: str, status: ClusterStatus) -> None:
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.entries[cluster_uid] = (time.monotonic(), status)
+
+    def invalidate(self, cluster_uid: str, view_id: Optional[str] = None) -> None:
+        """
+        Drop the cached diagnosis of the cluster. If view_id is given, the
+        entry is kept if it was taken in that same view.
+        """
+        with self.lock:
+            entry = self.entries.get(cluster_uid)
+            if entry and (view_id is None or entry[1].view_id != view_id):
+                del self.entries[cluster_uid]
+
+
+g_diagnosis_cache = DiagnosisCache(k_diagnosis_cache_ttl)
+
+
+def diagnose_instances(pods: Set[MySQLPod], logger) -> Dict[MySQLPod, InstanceStatus]:
+    """
+    Diagnose all given instances in parallel.
+
+    Each instance gets k_diagnose_connect_timeout to accept the connection and
+    all of them together get k_diagnose_timeout to finish. Instances that
+    don't make it in time are reported as UNKNOWN, as if they couldn't be
+    reached, and so are instances with an abandoned probe still running.
+    Errors raised by the probes are raised here.
+    """
+    statuses = {}
+    futures = {}
+    with _abandoned_probes_lock:
+        for pod in pods:
+            if (pod.namespace, pod.name) in _abandoned_probes:
+                logger.info(
+                    f"Previous diagnosis of {pod} is still running, skipping it")
+                statuses[pod] = _unknown_status(pod)
+            else:
+                futures[pod] = _diagnose_executor.submit(
+                    diagnose_instance, pod, logger,
+                    connect_timeout=k_diagnose_connect_timeout)
+    wait(futures.values(), timeout=k_diagnose_timeout)
+
+    for pod, future in futures.items():
+        if future.done():
+            statuses[pod] = future.result()
+            continue
+
+        statuses[pod] = _unknown_status(pod)
+        # cancel() only works for probes that haven't started yet
+        if future.cancel():
+            logger.info(
+                f"Diagnosis of {pod} did not start in {k_diagnose_timeout}s")
+            continue
+
+        logger.warning(
+            f"Diagnosis of {pod} did not finish in {k_diagnose_timeout}s, abandoning it")
+        _probes_abandoned.inc()
+        _track_abandoned_probe(pod, future)
+    return statuses
+
+
+def _unknown_status(pod: MySQLPod) -> InstanceStatus:
+    status = InstanceStatus()
+    status.pod = pod
+    return status
+
+
+def _track_abandoned_probe(pod: MySQLPod, future: Future) -> None:
+    key = (pod.namespace, pod.name)
+
+    def finished(f: Future) -> None:
+        # the result is dropped, the session went back to the pool
+        with _abandoned_probes_lock:
+            if _abandoned_probes.get(key) is f:
+                del _abandoned_probes[key]
+            _probes_running.set(len(_abandoned_probes))
+        print(f"Abandoned diagnosis of {key[0]}/{key[1]} finished")
+
+    with _abandoned_probes_lock:
+        _abandoned_probes[key] = future
+        _probes_running.set(len(_abandoned_probes))
+    future.add_done_callback(finished)
 
 
 def do_diagnose_cluster(cluster: InnoDBCluster, logger) -> ClusterStatus:
@@ -471,12 +718,11 @@ def do_diagnose_cluster(cluster: InnoDBCluster, logger) -> ClusterStatus:
     gtid_executed = {}
 
     online_pod_statuses = {}
-    for pod in all_pods:
+    for pod, status in diagnose_instances(all_pods, logger).items():
         # Diagnose the instance even if deleting - so we can remove it from the cluster and later re-add it
 #        if pod.deleting:
 #            logger.info(f"instance {pod} is deleting")
 #            continue
-        status = diagnose_instance(pod, logger)
         logger.info(
             f"diag instance {pod} --> {status.status} quorum={status.in_quorum} gtid_executed={status.gtid_executed}")
 
@@ -535,6 +781,7 @@ def do_diagnose_cluster(cluster: InnoDBCluster, logger) -> ClusterStatus:
             for p in active_partitions[0]:
                 if p.is_primary:
                     cluster_status.primary = p.pod
+                    cluster_status.view_id = p.view_id
                     break
         else:
             # split-brain
@@ -562,7 +809,7 @@ def do_diagnose_cluster(cluster: InnoDBCluster, logger) -> ClusterStatus:
     return cluster_status
 
 
-def diagnose_cluster(cluster: InnoDBCluster, logger) -> ClusterStatus:
+def diagnose_cluster(cluster: InnoDBCluster, logger, use_cache: bool = True) -> ClusterStatus:
     """
     Diagnose the state of an InnoDB cluster, assuming it was already initialized.
 
@@ -590,6 +837,18 @@ def diagnose_cluster(cluster: InnoDBCluster, logger) -> ClusterStatus:
     - Exceptions that indicate there's something wrong with the deployment are
     bubbled up. For example:
         - auth error on a pod that's already initialized
+    - A recent diagnosis of the same cluster is returned if there's one in
+    g_diagnosis_cache, unless use_cache is False
     """
 
-    return cast(ClusterStatus, shellutils.RetryLoop(logger).call(do_diagnose_cluster, cluster, logger))
+    if use_cache:
+        diag = g_diagnosis_cache.get(cluster.uid)
+        if diag:
+            logger.debug(
+                f"Using cached diagnosis of {cluster.name}: status={diag.status} view_id={diag.view_id}")
+            return diag
+
+    diag = cast(ClusterStatus, shellutils.RetryLoop(logger).call(do_diagnose_cluster, cluster, logger))
+    if diag.status not in (ClusterDiagStatus.INITIALIZING, ClusterDiagStatus.FINALIZING):
+        g_diagnosis_cache.put(cluster.uid, diag)
+    return diag
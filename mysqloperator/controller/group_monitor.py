@@ -4,38 +4,186 @@
 #
 
 from logging import Logger
-from typing import Callable, Optional, TYPE_CHECKING, Tuple
+from typing import Callable, Dict, List, Optional, TYPE_CHECKING, Tuple
 
 from mysqloperator.controller.innodbcluster.cluster_api import InnoDBCluster
 
 from mysqloperator.controller.shellutils import RetryLoop
 from . import shellutils
+from .xprotocol import XNoticeConnection, XProtocolError
+from . import xprotocol
+from .metrics import g_metrics
+from .diagnose import g_diagnosis_cache
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import asyncio
 import threading
+import random
 import time
-import select
+import os
 import mysqlsh
 
 mysql = mysqlsh.mysql
 mysqlx = mysqlsh.mysqlx
 
-k_connect_retry_interval = 10
+# Exponential backoff between reconnection attempts to a cluster (seconds)
+k_connect_backoff_base = 1
+k_connect_backoff_max = 60
+
+# Timeout for each connection attempt to a member (milliseconds)
+k_connect_timeout = int(os.getenv("MYSQL_OPERATOR_GROUP_MONITOR_CONNECT_TIMEOUT", default="2000"))
+
+# Number of threads used to try to connect to cluster members in parallel
+k_connect_workers = int(os.getenv("MYSQL_OPERATOR_GROUP_MONITOR_CONNECT_WORKERS", default="16"))
+
+# Number of threads used to run blocking session calls (connect, queries)
+# for the monitored clusters. Each cluster uses at most one at a time.
+k_session_workers = int(os.getenv("MYSQL_OPERATOR_GROUP_MONITOR_WORKERS", default="8"))
+
+# Number of threads used to run the handlers of monitored clusters
+k_handler_workers = int(os.getenv("MYSQL_OPERATOR_GROUP_MONITOR_HANDLER_WORKERS", default="4"))
+
+# View change notices received within this many milliseconds of the first one
+# in a burst (e.g. several members joining at once) are handled together, with
+# a single query of the final membership. Role and state changes end the
+# window right away, since they drive failover. Can be overridden per cluster
+# with the annotation below. 0 disables debouncing.
+k_debounce_window = int(os.getenv("MYSQL_OPERATOR_GROUP_MONITOR_DEBOUNCE_WINDOW", default="500"))
+k_debounce_window_annotation = "mysql.oracle.com/group-monitor-debounce-window"
+k_immediate_notices = (xprotocol.GR_MEMBER_ROLE_CHANGE,
+                       xprotocol.GR_MEMBER_STATE_CHANGE)
+
+# Idle notice connections are pinged every this many seconds, so that
+# half-open connections (e.g. to a node that went away) are detected
+# without waiting for the next view change
+k_ping_interval = int(os.getenv("MYSQL_OPERATOR_GROUP_MONITOR_PING_INTERVAL", default="10"))
+
+# Time to wait for a ping reply before dropping the connection (milliseconds)
+k_ping_timeout = int(os.getenv("MYSQL_OPERATOR_GROUP_MONITOR_PING_TIMEOUT", default=str(k_connect_timeout)))
+
+_ping_rtt = g_metrics.histogram(
+    "mysql_operator_group_monitor_ping_seconds",
+    "Round trip time of keepalive pings to the monitored member")
+_ping_failures = g_metrics.counter(
+    "mysql_operator_group_monitor_ping_failures_total",
+    "Keepalive pings that failed or timed out")
+_reconnect_time = g_metrics.histogram(
+    "mysql_operator_group_monitor_reconnect_seconds",
+    "Time from losing the connection to a cluster until it was reconnected")
+_notices_received = g_metrics.counter(
+    "mysql_operator_group_monitor_notices_total",
+    "GR notices received from monitored clusters")
+_notices_coalesced = g_metrics.counter(
+    "mysql_operator_group_monitor_coalesced_notices_total",
+    "GR notices merged into the handling of an earlier notice of the same burst")
+_handler_calls_coalesced = g_metrics.counter(
+    "mysql_operator_group_monitor_coalesced_handler_calls_total",
+    "Queued handler calls replaced by a newer call before running")
+
+_connect_executor = ThreadPoolExecutor(max_workers=k_connect_workers,
+                                       thread_name_prefix="group-monitor-connect")
+
+
+class HandlerDispatcher:
+    """
+    Runs handler calls in a bounded thread pool, so that slow handlers
+    (e.g. because of a slow API server) don't delay reading notices.
+
+    Calls for the same cluster run one at a time, in the order they were
+    submitted. A call submitted while the previous one of the same kind is
+    still queued replaces it, so only the latest view is applied.
+    """
+
+    def __init__(self, max_workers: int):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix="group-monitor-handler")
+        self.lock = threading.Lock()
+        self.queues: Dict[Tuple[str, str], List[tuple]] = {}
+
+    def submit(self, key: Tuple[str, str], kind: str, handler: Callable,
+               args: tuple, merge: Optional[Callable[[tuple, tuple], tuple]] = None) -> None:
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue is None:
+                # nothing queued or running for this cluster
+                self.queues[key] = [(kind, handler, args)]
+                self.executor.submit(self._run, key)
+                return
+
+            if queue and queue[-1][0] == kind:
+                _handler_calls_coalesced.inc(namespace=key[0], cluster=key[1],
+                                             kind=kind)
+                if merge:
+                    args = merge(queue[-1][2], args)
+                queue[-1] = (kind, handler, args)
+            else:
+                queue.append((kind, handler, args))
+
+    def discard(self, key: Tuple[str, str]) -> None:
+        with self.lock:
+            queue = self.queues.get(key)
+            if queue:
+                # the call currently running (if any) is not in the queue
+                del queue[:]
+
+    def _run(self, key: Tuple[str, str]) -> None:
+        while True:
+            with self.lock:
+                queue = self.queues[key]
+                if not queue:
+                    del self.queues[key]
+                    return
+                kind, handler, args = queue.pop(0)
+                # keep the entry while running, so that new calls get queued
+                # behind this one instead of running concurrently
+
+            try:
+                handler(*args)
+            except Exception as e:
+                print(
+                    f"GroupMonitor: Error in {kind} handler for {key[0]}/{key[1]}: {e}")
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False)
+
+
+def _merge_view_change(old: tuple, new: tuple) -> tuple:
+    # apply the latest members, but keep track of whether the view changed
+    cluster, members, view_id_changed = new
+    return cluster, members, old[2] or view_id_changed
 
 
 class MonitoredCluster:
     def __init__(self, cluster: InnoDBCluster,
-                 account: Tuple[str, str],
-                 handler: Callable[[InnoDBCluster, list, bool], None]):
+                 logger: Logger,
+                 handler: Callable[[InnoDBCluster, list, bool], None],
+                 role_handler: Optional[Callable[[InnoDBCluster, list], None]] = None,
+                 dispatcher: Optional[HandlerDispatcher] = None):
         self.cluster = cluster
-        self.account = account
+        self.logger = logger
+        # fetched by the monitor task, the Secret may not be ready yet
+        self.account: Optional[Tuple[str, str]] = None
 
         self.session = None
+        # X Protocol connection to the same member as session, for notices
+        self.notices: Optional[XNoticeConnection] = None
         self.target = None
+        self.target_co = None
         self.target_not_primary = None
         self.last_connect_attempt = 0
+        self.connect_failures = 0
+        # time.monotonic() of when the connection was lost, if it was
+        self.disconnected_at: Optional[float] = None
         self.last_primary_id = None
         self.last_view_id = None
 
         self.handler = handler
+        self.role_handler = role_handler
+        self.dispatcher = dispatcher
+
+        self.debounce_window = self.get_debounce_window()
+
+        # Serializes session access between the monitor task and its cleanup
+        self.lock = threading.Lock()
 
     @property
     def name(self) -> str:
@@ -45,22 +193,42 @@ class MonitoredCluster:
     def namespace(self) -> str:
         return self.cluster.namespace
 
+    def get_debounce_window(self) -> float:
+        """
+        Debounce window for this cluster, in seconds.
+        """
+        annotations = self.cluster.metadata.get("annotations") or {}
+        window = annotations.get(k_debounce_window_annotation)
+        if window is not None:
+            try:
+                return max(0, int(window)) / 1000
+            except ValueError:
+                print(
+                    f"GroupMonitor: Invalid {k_debounce_window_annotation} for {self.namespace}/{self.name}: {window}")
+        return k_debounce_window / 1000
+
     def ensure_connected(self) -> Optional['mysqlx.Session']:
-        # TODO run a ping every X seconds
-        if not self.session and (not self.last_connect_attempt or time.time() - self.last_connect_attempt > k_connect_retry_interval):
+        with self.lock:
+            return self._ensure_connected()
+
+    def _ensure_connected(self) -> Optional['mysqlx.Session']:
+        # dead connections are detected by the keepalive pings of the
+        # monitor task, which then closes the session
+        # retries are paced by the monitor task, which waits
+        # connect_backoff() seconds between failed attempts
+        if not self.session:
             print(
                 f"GroupMonitor: Trying to connect to a member of cluster {self.cluster.namespace}/{self.cluster.name}")
             self.last_connect_attempt = time.time()
             self.session = None
             self.connect_to_primary()
 
-            # force a refresh after we connect so we don't miss anything
-            # that happened while we were out
             if self.session:
                 print(
                     f"GroupMonitor: Connect member of {self.cluster.namespace}/{self.cluster.name} OK {self.session}")
-                self.on_view_change(None)
+                self.connect_failures = 0
             else:
+                self.connect_failures += 1
                 print(
                     f"GroupMonitor: Connect to member of {self.cluster.namespace}/{self.cluster.name} failed")
 
@@ -82,9 +250,9 @@ class MonitoredCluster:
                     # extend number of seconds for the server to wait for a command to arrive to a full day
                     session.run_sql(
                         f"set session mysqlx_wait_timeout = {24*60*60}")
-                    session._enable_notices(["GRViewChanged"])
                     co = shellutils.parse_uri(session.uri)
                     self.target = f"{co['host']}:{co['port']}"
+                    self.target_co = co
                     self.target_not_primary = not is_primary
                     self.session = session
                 except mysqlsh.Error as e:
@@ -98,71 +266,159 @@ class MonitoredCluster:
             break
 
     def find_primary(self) -> Tuple[Optional['mysqlx.Session'], bool]:
-        not_primary = None
+        """
+        Connect to all pods in parallel and return a session to the PRIMARY.
 
+        Every candidate is tried at the same time with a short connect timeout,
+        so unreachable pods don't delay finding a reachable one. If the PRIMARY
+        can't be reached, a session to any other member is returned.
+        """
         pods = self.cluster.get_pods()
-        # Try to find the PRIMARY the easy way
-        for pod in pods:
-            member_info = pod.get_membership_info()
-            if member_info and member_info.get("role") == "PRIMARY":
-                session = self.try_connect(pod)
-                if session:
-                    s = shellutils.jump_to_primary(session, self.account)
-                    if s:
-                        if s != session:
-                            session.close()
-                        return s, True
-                    else:
-                        not_primary = session
+        if not pods:
+            return None, False
 
-        # Try to connect to anyone and find the primary from there
-        for pod in pods:
+        def try_pod(pod) -> Tuple[Optional['mysqlx.Session'], bool]:
             session = self.try_connect(pod)
             if session:
-                s = shellutils.jump_to_primary(session, self.account)
+                s = shellutils.jump_to_primary(session, self.account,
+                                               connect_timeout=k_connect_timeout)
                 if s:
                     if s != session:
                         session.close()
                     return s, True
-                else:
+                return session, False
+            return None, False
+
+        def discard(future: Future) -> None:
+            try:
+                session, _ = future.result()
+                if session:
+                    session.close()
+            except Exception:
+                pass
+
+        pending = set(_connect_executor.submit(try_pod, pod) for pod in pods)
+        not_primary = None
+        primary = None
+        while pending and not primary:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    session, is_primary = future.result()
+                except Exception as e:
+                    print(f"GroupMonitor: Error looking for PRIMARY: {e}")
+                    continue
+                if not session:
+                    continue
+                if is_primary and not primary:
+                    primary = session
+                elif not not_primary:
                     not_primary = session
+                else:
+                    session.close()
+
+        # close whatever the slower attempts return
+        for future in pending:
+            future.add_done_callback(discard)
+
+        if primary:
+            if not_primary:
+                not_primary.close()
+            return primary, True
 
         return not_primary, False
 
     def try_connect(self, pod) -> Optional['mysqlx.Session']:
+        co = pod.xendpoint_co
+        co["connect-timeout"] = k_connect_timeout
         try:
-            session = mysqlx.get_session(pod.xendpoint_co)
+            session = mysqlx.get_session(co)
         except mysqlsh.Error as e:
             print(f"GroupMonitor: Error connecting to {pod.xendpoint}: {e}")
             return None
 
         return session
 
-    def handle_notice(self) -> None:
-        while 1:
-            try:
-                # TODO hack to force unexpected async notice to be read, xsession should read packets itself
-                self.session.run_sql("select 1")
-                notice = self.session._fetch_notice()
-                if not notice:
-                    break
-                print(f"GOT NOTICE {notice}")
-                self.on_view_change(notice.get("view_id"))
-                if not self.session:
-                    break
-
-            except mysqlsh.Error as e:
-                print(
-                    f"GroupMonitor: Error fetching notice: dest={self.target} error={e}")
-                self.session.close()
+    def connect_backoff(self) -> float:
+        """
+        Seconds to wait before the next connection attempt.
+        Doubles with every consecutive failure, with jitter so that clusters
+        that went down together don't all retry at the same time.
+        """
+        delay = min(k_connect_backoff_max,
+                    k_connect_backoff_base * 2 ** min(self.connect_failures, 16))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def disconnect(self) -> None:
+        with self.lock:
+            if self.session:
+                try:
+                    self.session.close()
+                except mysqlsh.Error as e:
+                    print(
+                        f"GroupMonitor: Error closing session to {self.target}: {e}")
                 self.session = None
-                break
 
-    def on_view_change(self, view_id: Optional[str]) -> None:
+    def refresh(self) -> None:
+        """
+        Query the current membership and pass it to the handler, e.g. after
+        (re)connecting so that we don't miss anything that happened while we
+        were out.
+        """
+        with self.lock:
+            if self.session:
+                self._on_view_change_or_disconnect(None)
+
+    def handle_notices(self, notices: List[xprotocol.GRNotice]) -> None:
+        """
+        Handle a burst of notices with a single query of the membership,
+        which already reflects all of them.
+        """
+        with self.lock:
+            if self.session:
+                member_change = any(
+                    n.type in k_immediate_notices for n in notices)
+                self._on_view_change_or_disconnect(notices[-1].view_id,
+                                                   member_change)
+
+    def _on_view_change_or_disconnect(self, view_id: Optional[str],
+                                      member_change: bool = False) -> None:
+        try:
+            self.on_view_change(view_id, member_change)
+        except mysqlsh.Error as e:
+            print(
+                f"GroupMonitor: Error querying members: dest={self.target} error={e}")
+            self.session.close()
+            self.session = None
+
+    def on_view_change(self, view_id: Optional[str],
+                       member_change: bool = False) -> None:
+        # role and state changes don't change the view id
+        g_diagnosis_cache.invalidate(self.cluster.uid,
+                                     None if member_change else view_id)
+
         members = shellutils.query_members(self.session)
-        self.handler(self.cluster, members, view_id != self.last_view_id)
+        # A member changed role or state, e.g. a new PRIMARY was elected or a
+        # member finished RECOVERING. Update the role labels before anything
+        # else, since they are what routes traffic to the PRIMARY
+        if member_change and self.role_handler:
+            self.dispatch("role", self.role_handler, (self.cluster, members))
+        self.dispatch("view", self.handler,
+                      (self.cluster, members, view_id != self.last_view_id),
+                      merge=_merge_view_change)
         self.last_view_id = view_id
 
+        self.check_primary(members)
+
+    def dispatch(self, kind: str, handler: Callable, args: tuple,
+                 merge: Optional[Callable[[tuple, tuple], tuple]] = None) -> None:
+        if self.dispatcher:
+            self.dispatcher.submit((self.namespace, self.name), kind, handler,
+                                   args, merge)
+        else:
+            handler(*args)
+
+    def check_primary(self, members: list) -> None:
         primary = None
         force_reconnect = False
         for member_id, role, status, view_id, endpoint, version in members:
@@ -172,6 +428,9 @@ class MonitoredCluster:
             if role == "PRIMARY" and not primary:
                 primary = member_id
 
+        if primary != self.last_primary_id or force_reconnect:
+            # cached AdminAPI handles are bound to the old PRIMARY
+            shellutils.g_cluster_handles.invalidate(self.cluster.uid)
         self.last_primary_id = primary
 
         # force reconnection if the PRIMARY changed or we're not connected to the PRIMARY
@@ -183,55 +442,271 @@ class MonitoredCluster:
                 self.session = None
 
 
-# TODO change this to a per cluster kopf.daemon?
 class GroupMonitor(threading.Thread):
+    """
+    Watches the group view of every InnoDB Cluster managed by the operator.
+
+    The monitor runs its own asyncio event loop in a dedicated thread, with one
+    task per monitored cluster. Each task keeps a shell session to the PRIMARY
+    for queries and a native X Protocol connection to the same member on which
+    GR notices are decoded as they arrive, so notices are processed without
+    extra round trips and clusters added or removed from other threads are
+    picked up immediately. Blocking session calls run in a small thread pool.
+    """
+
     def __init__(self):
         super().__init__(daemon=True, name="group-monitor")
 
-        self.clusters = []
+        self.clusters = {}
+        self.tasks = {}
+        self.lock = threading.Lock()
         self.stopped = False
 
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor(max_workers=k_session_workers,
+                                           thread_name_prefix="group-monitor")
+        self.dispatcher = HandlerDispatcher(k_handler_workers)
+        self.stop_event: Optional[asyncio.Event] = None
+
+    def _cluster_key(self, cluster: InnoDBCluster) -> Tuple[str, str]:
+        return (cluster.namespace, cluster.name)
+
     def monitor_cluster(self, cluster: InnoDBCluster,
                         handler: Callable[[InnoDBCluster, list, bool], None],
-                        logger: Logger) -> None:
-        for c in self.clusters:
-            if c.name == cluster.name and c.namespace == cluster.namespace:
+                        logger: Logger,
+                        role_handler: Optional[Callable[[InnoDBCluster, list], None]] = None) -> None:
+        key = self._cluster_key(cluster)
+        with self.lock:
+            if key in self.clusters:
                 return
 
-        # We could get called here before the Secret is ready
-        account = RetryLoop(logger).call(cluster.get_admin_account)
+        target = MonitoredCluster(cluster, logger, handler, role_handler,
+                                  self.dispatcher)
+        with self.lock:
+            if key in self.clusters:
+                return
+            self.clusters[key] = target
 
-        target = MonitoredCluster(cluster, account, handler)
-        self.clusters.append(target)
+        # Wake up the monitor loop, the task starts right away
+        self.loop.call_soon_threadsafe(self._start_task, key)
         print(f"Added monitor for {cluster.namespace}/{cluster.name}")
 
+    def update_cluster(self, cluster: InnoDBCluster) -> None:
+        """
+        Pick up changes of the cluster object, like the debounce window
+        annotation.
+        """
+        with self.lock:
+            target = self.clusters.get(self._cluster_key(cluster))
+        if target:
+            target.cluster = cluster
+            target.debounce_window = target.get_debounce_window()
+
     def remove_cluster(self, cluster: InnoDBCluster) -> None:
-        for c in self.clusters:
-            if c.name == cluster.name and c.namespace == cluster.namespace:
-                self.clusters.remove(c)
+        key = self._cluster_key(cluster)
+        with self.lock:
+            if key not in self.clusters:
+                return
+            del self.clusters[key]
+
+        self.dispatcher.discard(key)
+        for metric in (_notices_received, _notices_coalesced, _ping_rtt,
+                       _ping_failures, _reconnect_time):
+            metric.remove(namespace=key[0], cluster=key[1])
+        self.loop.call_soon_threadsafe(self._stop_task, key)
+
+    def _start_task(self, key: Tuple[str, str]) -> None:
+        with self.lock:
+            cluster = self.clusters.get(key)
+        if cluster and key not in self.tasks and not self.stopped:
+            self.tasks[key] = self.loop.create_task(self._monitor(cluster))
+
+    def _stop_task(self, key: Tuple[str, str]) -> None:
+        task = self.tasks.pop(key, None)
+        if task:
+            task.cancel()
+
+    async def _get_admin_account(self, cluster: MonitoredCluster) -> Tuple[str, str]:
+        return await self.loop.run_in_executor(
+            self.executor, cluster.cluster.get_admin_account)
+
+    async def _connect(self, cluster: MonitoredCluster) -> bool:
+        if cluster.session and cluster.notices:
+            return True
+
+        await self._disconnect(cluster)
+
+        if not cluster.account:
+            # We could get here before the Secret is ready
+            cluster.account = await RetryLoop(cluster.logger).call_async(
+                self._get_admin_account, cluster)
+
+        session = await self.loop.run_in_executor(
+            self.executor, cluster.ensure_connected)
+        if not session:
+            return False
+
+        user, password = cluster.account
+        try:
+            cluster.notices = await XNoticeConnection.connect(
+                cluster.target_co["host"], cluster.target_co["port"],
+                user, password, timeout=k_connect_timeout/1000)
+            await cluster.notices.execute(
+                f"set session mysqlx_wait_timeout = {24*60*60}")
+            await cluster.notices.enable_notices([
+                xprotocol.NOTICE_GR_VIEW,
+                xprotocol.NOTICE_GR_ROLE_CHANGE,
+                xprotocol.NOTICE_GR_STATE_CHANGE])
+        except (OSError, asyncio.TimeoutError, XProtocolError) as e:
+            print(
+                f"GroupMonitor: Error subscribing to notices: dest={cluster.target} error={e}")
+            cluster.connect_failures += 1
+            await self._disconnect(cluster)
+            return False
+
+        # refresh only after subscribing, so that no view change is missed
+        await self.loop.run_in_executor(self.executor, cluster.refresh)
+        if not cluster.session:
+            # not connected to the PRIMARY or it changed in the meantime
+            cluster.connect_failures += 1
+            return False
+
+        if cluster.disconnected_at is not None:
+            _reconnect_time.observe(time.monotonic() - cluster.disconnected_at,
+                                    namespace=cluster.namespace,
+                                    cluster=cluster.name)
+            cluster.disconnected_at = None
+        return True
+
+    async def _disconnect(self, cluster: MonitoredCluster) -> None:
+        if cluster.notices and cluster.disconnected_at is None:
+            cluster.disconnected_at = time.monotonic()
+        if cluster.notices:
+            cluster.notices.close()
+            cluster.notices = None
+        if cluster.session:
+            await self.loop.run_in_executor(self.executor, cluster.disconnect)
+
+    async def _monitor(self, cluster: MonitoredCluster) -> None:
+        try:
+            while True:
+                if not await self._connect(cluster):
+                    await asyncio.sleep(cluster.connect_backoff())
+                    continue
+
+                try:
+                    notices = await self._read_notices(cluster)
+                except (OSError, asyncio.TimeoutError, XProtocolError) as e:
+                    print(
+                        f"GroupMonitor: Error fetching notice: dest={cluster.target} error={e}")
+                    await self._disconnect(cluster)
+                    continue
+
+                await self.loop.run_in_executor(
+                    self.executor, cluster.handle_notices, notices)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            print(
+                f"GroupMonitor: Unexpected error monitoring {cluster.namespace}/{cluster.name}: {e}")
+            # restart the task so that the cluster stays monitored
+            cluster.connect_failures += 1
+            self.loop.call_later(cluster.connect_backoff(),
+                                 self._restart_task, cluster)
+        finally:
+            await self._disconnect(cluster)
+
+    async def _wait_notice(self, cluster: MonitoredCluster) -> xprotocol.GRNotice:
+        """
+        Wait for the next notice, pinging the member whenever the connection
+        has been idle for k_ping_interval seconds.
+        """
+        while True:
+            try:
+                return await asyncio.wait_for(cluster.notices.read_notice(),
+                                              k_ping_interval)
+            except asyncio.TimeoutError:
+                await self._ping(cluster)
+
+    async def _ping(self, cluster: MonitoredCluster) -> None:
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(cluster.notices.ping(), k_ping_timeout/1000)
+        except (OSError, asyncio.TimeoutError, XProtocolError):
+            _ping_failures.inc(namespace=cluster.namespace, cluster=cluster.name)
+            raise
+        _ping_rtt.observe(time.monotonic() - start,
+                          namespace=cluster.namespace, cluster=cluster.name)
+
+    async def _read_notices(self, cluster: MonitoredCluster) -> List[xprotocol.GRNotice]:
+        """
+        Wait for a notice and collect any others that arrive within the
+        debounce window of the cluster, until a role or state change.
+        """
+        notices = [await self._wait_notice(cluster)]
+        deadline = self.loop.time() + cluster.debounce_window
+        while notices[-1].type not in k_immediate_notices:
+            timeout = deadline - self.loop.time()
+            if timeout <= 0:
+                break
+            try:
+                notices.append(await asyncio.wait_for(
+                    cluster.notices.read_notice(), timeout))
+            except asyncio.TimeoutError:
                 break
 
+        _notices_received.inc(len(notices), namespace=cluster.namespace,
+                              cluster=cluster.name)
+        if len(notices) > 1:
+            _notices_coalesced.inc(len(notices) - 1,
+                                   namespace=cluster.namespace,
+                                   cluster=cluster.name)
+        return notices
+
+    def _restart_task(self, cluster: MonitoredCluster) -> None:
+        key = (cluster.namespace, cluster.name)
+        with self.lock:
+            current = self.clusters.get(key)
+        if current is cluster:
+            self.tasks.pop(key, None)
+            self._start_task(key)
+
+    async def _main(self) -> None:
+        self.stop_event = asyncio.Event()
+        if self.stopped:
+            return
+
+        with self.lock:
+            keys = list(self.clusters.keys())
+        for key in keys:
+            self._start_task(key)
+
+        await self.stop_event.wait()
+
+        tasks = list(self.tasks.values())
+        self.tasks = {}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
     def run(self) -> None:
-        last_ping = time.time()
-        while not self.stopped:
-            session_fds_to_cluster = {}
-            for cluster in self.clusters:
-                cluster.ensure_connected()
-                if cluster.session:
-                    session_fds_to_cluster[cluster.session._get_socket_fd()] = cluster
-
-            # wait for 1s at most so that newly added session don't wait much
-            # TODO replace poll_sessions() with something to get the session fd
-            # - do the poll loop in python
-            # - add a socket_pair() to allow interrupting the poll when a new
-            # cluster is added and increase the timeout
-
-            ready, _, _ = select.select(session_fds_to_cluster.keys(), [], [], 1000)
-            for fd in ready:
-                session_fds_to_cluster[fd].handle_notice()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        finally:
+            self.executor.shutdown(wait=False)
+            self.dispatcher.shutdown()
+            self.loop.close()
 
     def stop(self) -> None:
         self.stopped = True
 
+        def wakeup():
+            if self.stop_event:
+                self.stop_event.set()
+
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(wakeup)
+
 
 g_group_monitor = GroupMonitor()
@@ -0,0 +1,133 @@
+# Copyright (c) 2020, 2021, Oracle and/or its affiliates.
+#
+# Licensed under the Universal Permissive License v 1.0 as shown at https://oss.oracle.com/licenses/upl/
+#
+
+# GTID set arithmetic, done locally instead of with GTID_SUBTRACT() etc
+# in the server.
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+Interval = Tuple[int, int]
+
+
+def _normalize(intervals: Iterable[Interval]) -> List[Interval]:
+    """Sort and merge overlapping and adjacent intervals"""
+    result: List[Interval] = []
+    for start, end in sorted(intervals):
+        if result and start <= result[-1][1] + 1:
+            if end > result[-1][1]:
+                result[-1] = (result[-1][0], end)
+        else:
+            result.append((start, end))
+    return result
+
+
+def _subtract(a: List[Interval], b: List[Interval]) -> List[Interval]:
+    result: List[Interval] = []
+    i = 0
+    for start, end in a:
+        # skip intervals of b that end before this one
+        while i < len(b) and b[i][1] < start:
+            i += 1
+        j = i
+        while j < len(b) and b[j][0] <= end:
+            if b[j][0] > start:
+                result.append((start, b[j][0] - 1))
+            start = max(start, b[j][1] + 1)
+            if start > end:
+                break
+            j += 1
+        if start <= end:
+            result.append((start, end))
+    return result
+
+
+def _contains(a: List[Interval], b: List[Interval]) -> bool:
+    i = 0
+    for start, end in b:
+        while i < len(a) and a[i][1] < start:
+            i += 1
+        if i == len(a) or a[i][0] > start or a[i][1] < end:
+            return False
+    return True
+
+
+class GtidSet:
+    """
+    A set of GTIDs, parsed once into a sorted list of closed intervals of
+    transaction numbers per source UUID.
+
+    Parses and formats the same syntax as @@gtid_executed.
+    """
+
+    __slots__ = ("intervals",)
+
+    def __init__(self, intervals: Optional[Dict[str, List[Interval]]] = None):
+        # uuid -> sorted, non-overlapping, non-adjacent intervals
+        self.intervals: Dict[str, List[Interval]] = intervals or {}
+
+    @classmethod
+    def parse(cls, gtid_set: Optional[str]) -> 'GtidSet':
+        ranges: Dict[str, List[Interval]] = {}
+        for item in (gtid_set or "").replace("\n", "").split(","):
+            item = item.strip()
+            if not item:
+                continue
+            uuid, *parts = item.split(":")
+            if not parts:
+                raise ValueError(f"Invalid GTID set: {gtid_set}")
+            uuid = uuid.strip().lower()
+            for r in parts:
+                begin, _, end = r.partition("-")
+                begin = int(begin)
+                end = int(end) if end else begin
+                if begin < 1 or end < begin:
+                    raise ValueError(f"Invalid GTID set: {gtid_set}")
+                ranges.setdefault(uuid, []).append((begin, end))
+        return cls({uuid: _normalize(r) for uuid, r in ranges.items()})
+
+    def __str__(self) -> str:
+        def fmt(start, end):
+            return str(start) if start == end else f"{start}-{end}"
+        return ",\n".join(
+            uuid + "".join(":" + fmt(s, e) for s, e in self.intervals[uuid])
+            for uuid in sorted(self.intervals))
+
+    def __repr__(self) -> str:
+        return f"GtidSet({str(self)!r})"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, GtidSet) and self.intervals == other.intervals
+
+    def __bool__(self) -> bool:
+        return bool(self.intervals)
+
+    def count(self) -> int:
+        """Number of transactions in the set"""
+        return sum(e - s + 1 for r in self.intervals.values() for s, e in r)
+
+    def union(self, other: 'GtidSet') -> 'GtidSet':
+        result = dict(self.intervals)
+        for uuid, r in other.intervals.items():
+            result[uuid] = _normalize(result.get(uuid, []) + r)
+        return GtidSet(result)
+
+    def subtract(self, other: 'GtidSet') -> 'GtidSet':
+        result = {}
+        for uuid, r in self.intervals.items():
+            if uuid in other.intervals:
+                r = _subtract(r, other.intervals[uuid])
+            if r:
+                result[uuid] = r
+        return GtidSet(result)
+
+    def contains(self, other: 'GtidSet') -> bool:
+        """True if every GTID in other is also in this set"""
+        for uuid, r in other.intervals.items():
+            if not _contains(self.intervals.get(uuid, []), r):
+                return False
+        return True
+
+    __or__ = union
+    __sub__ = subtract
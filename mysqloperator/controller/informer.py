@@ -0,0 +1,353 @@
+# Copyright (c) 2020, 2021, Oracle and/or its affiliates.
+#
+# Licensed under the Universal Permissive License v 1.0 as shown at https://oss.oracle.com/licenses/upl/
+#
+
+# Process-wide caches of the k8s objects the operator reads all the time
+# (pods, clusters, StatefulSets, Deployments and Secrets), kept up to date
+# with a watch, so that reading them doesn't cost an API call.
+#
+# Readers must fall back to the API when an informer is not synced or an
+# object is not found in it, since objects just created may not have been
+# seen by the watch yet.
+
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from kubernetes import watch
+from .kubeutils import api_core, api_apps, api_customobj, ApiException
+from . import consts
+import collections
+import threading
+import json
+import os
+import time
+
+# Whether to use the informers at all
+k_informers_enabled = os.getenv("MYSQL_OPERATOR_INFORMERS", default="1") == "1"
+
+# Watch requests are restarted after this many seconds
+k_watch_timeout = 300
+
+# Wait before relisting after an error (seconds)
+k_retry_delay = 5
+
+# Everything is listed again every this many seconds, in case the cache
+# drifted from the API server (e.g. events missed while the watch restarted)
+k_relist_interval = int(os.getenv("MYSQL_OPERATOR_INFORMER_RELIST_INTERVAL", default="1800"))
+
+# Number of deleted objects remembered, so that copies of them from other
+# sources are not stored back by update()
+k_tombstones = 1024
+
+Key = Tuple[str, str]
+
+# Index functions return the value of an object for the index, or a list of
+# values if it must be found under several of them
+IndexValue = Union[None, str, List[str]]
+
+
+def _metadata(obj: Any) -> Tuple[str, str, Optional[str], dict, list]:
+    """
+    Return namespace, name, resourceVersion, labels and owner kinds of an
+    object, which can be a typed model or a dict (custom objects)
+    """
+    if isinstance(obj, dict):
+        md = obj["metadata"]
+        return (md.get("namespace"), md["name"], md.get("resourceVersion"),
+                md.get("labels") or {},
+                [o.get("kind") for o in md.get("ownerReferences") or []])
+    md = obj.metadata
+    return (md.namespace, md.name, md.resource_version, md.labels or {},
+            [o.kind for o in md.owner_references or []])
+
+
+def _uid(obj: Any) -> Optional[str]:
+    if isinstance(obj, dict):
+        return obj["metadata"].get("uid")
+    return obj.metadata.uid
+
+
+def _newer(rv: Optional[str], than: Optional[str]) -> bool:
+    # resourceVersions are opaque, but in practice they're increasing integers
+    try:
+        return int(rv) >= int(than)
+    except (TypeError, ValueError):
+        return True
+
+
+def _index_values(value: IndexValue) -> List[str]:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    return value
+
+
+def owned_by_cluster(obj: Any) -> bool:
+    return consts.INNODBCLUSTER_KIND in _metadata(obj)[4]
+
+
+class Informer(threading.Thread):
+    """
+    Lists all objects returned by list_func and keeps them up to date with
+    a watch. Objects can be looked up by namespace and name or by the value
+    of an index.
+
+    With raw=True objects are kept as the dicts parsed from the API response
+    instead of being deserialized into models.
+
+    Listeners are called with the namespace and name of each object changed
+    by the watch, and with (None, None) when everything was listed again.
+    """
+
+    def __init__(self, name: str, list_func: Callable, list_args: tuple = (),
+                 list_kwargs: Optional[dict] = None,
+                 keep: Optional[Callable[[Any], bool]] = None,
+                 indexes: Optional[Dict[str, Callable[[Any], IndexValue]]] = None,
+                 raw: bool = False):
+        super().__init__(daemon=True, name=f"informer-{name}")
+        self.kind = name
+        self.list_func = list_func
+        self.list_args = list_args
+        self.list_kwargs = list_kwargs or {}
+        self.keep = keep
+        self.index_funcs = indexes or {}
+        self.raw = raw
+
+        self.lock = threading.Lock()
+        self.objects: Dict[Key, Any] = {}
+        self.indexes: Dict[str, Dict[Key, Dict[Key, Any]]] = {
+            index: {} for index in self.index_funcs}
+
+        # uid -> resourceVersion of recently deleted objects
+        self.tombstones: Dict[str, Optional[str]] = collections.OrderedDict()
+        self.listeners: List[Callable[[Optional[str], Optional[str]], None]] = []
+
+        self.synced = threading.Event()
+        self.stop_event = threading.Event()
+        self.watch: Optional[watch.Watch] = None
+
+    def add_listener(self, func: Callable[[Optional[str], Optional[str]], None]) -> None:
+        self.listeners.append(func)
+
+    def _notify(self, namespace: Optional[str], name: Optional[str]) -> None:
+        for func in self.listeners:
+            try:
+                func(namespace, name)
+            except Exception as e:
+                print(f"Informer {self.kind}: error in listener: {e}")
+
+    def get(self, namespace: str, name: str) -> Optional[Any]:
+        """
+        Return the cached object, or None if it's not cached (which doesn't
+        mean it doesn't exist).
+        """
+        if not self.synced.is_set():
+            return None
+        with self.lock:
+            return self.objects.get((namespace, name))
+
+    def list_indexed(self, index: str, namespace: str, value: str) -> Optional[List[Any]]:
+        """
+        Return the objects in namespace with the given index value, or None
+        if the informer is not synced.
+        """
+        if not self.synced.is_set():
+            return None
+        with self.lock:
+            return list(self.indexes[index].get((namespace, value), {}).values())
+
+    def list(self, namespace: Optional[str] = None) -> Optional[List[Any]]:
+        """
+        Return all objects, or those in namespace, or None if the informer is
+        not synced.
+        """
+        if not self.synced.is_set():
+            return None
+        with self.lock:
+            return [obj for (ns, _), obj in self.objects.items()
+                    if namespace is None or ns == namespace]
+
+    def update(self, obj: Any) -> None:
+        """
+        Store an object we got from elsewhere (e.g. the result of a patch),
+        unless the cache already has a newer version of it or the watch has
+        seen it deleted.
+        """
+        namespace, name, rv, _, _ = _metadata(obj)
+        with self.lock:
+            if _uid(obj) in self.tombstones:
+                return
+            old = self.objects.get((namespace, name))
+            if old is not None and not _newer(rv, _metadata(old)[2]):
+                return
+            self._store(obj)
+
+    def _store(self, obj: Any) -> None:
+        namespace, name, _, _, _ = _metadata(obj)
+        key = (namespace, name)
+        self._remove(key)
+        if self.keep and not self.keep(obj):
+            return
+        self.objects[key] = obj
+        for index, func in self.index_funcs.items():
+            for value in _index_values(func(obj)):
+                self.indexes[index].setdefault((namespace, value), {})[key] = obj
+
+    def _remove(self, key: Key) -> None:
+        obj = self.objects.pop(key, None)
+        if obj is None:
+            return
+        for index, func in self.index_funcs.items():
+            for value in _index_values(func(obj)):
+                entries = self.indexes[index].get((key[0], value))
+                if entries is not None:
+                    entries.pop(key, None)
+                    if not entries:
+                        del self.indexes[index][(key[0], value)]
+
+    def _add_tombstone(self, obj: Any) -> None:
+        self.tombstones[_uid(obj)] = _metadata(obj)[2]
+        while len(self.tombstones) > k_tombstones:
+            self.tombstones.popitem(last=False)
+
+    def _list(self) -> str:
+        if self.raw:
+            result = json.loads(self.list_func(*self.list_args,
+                                               _preload_content=False,
+                                               **self.list_kwargs).data)
+        else:
+            result = self.list_func(*self.list_args, **self.list_kwargs)
+        if isinstance(result, dict):
+            items = result["items"]
+            rv = result["metadata"]["resourceVersion"]
+        else:
+            items = result.items
+            rv = result.metadata.resource_version
+
+        with self.lock:
+            self.objects = {}
+            self.indexes = {index: {} for index in self.index_funcs}
+            for obj in items:
+                self._store(obj)
+        self.synced.set()
+        self._notify(None, None)
+        return rv
+
+    def _watch(self, rv: str) -> Optional[str]:
+        """
+        Apply changes until the watch times out. Returns the resourceVersion
+        to continue from or None if a new list is needed.
+        """
+        if self.raw:
+            # Watch deserializes into the type named in the docstring of the
+            # function, which this wrapper doesn't have
+            def list_func(*args, **kwargs):
+                return self.list_func(*args, **kwargs)
+        else:
+            list_func = self.list_func
+
+        self.watch = watch.Watch()
+        for event in self.watch.stream(list_func, *self.list_args,
+                                       resource_version=rv,
+                                       timeout_seconds=k_watch_timeout,
+                                       **self.list_kwargs):
+            etype = event["type"]
+            obj = event["object"]
+            if etype == "ERROR":
+                # e.g. 410 Gone when rv is too old
+                print(f"Informer {self.kind}: watch error {event['raw_object']}")
+                return None
+
+            rv = _metadata(obj)[2] or rv
+            if etype == "BOOKMARK":
+                continue
+            namespace, name, _, _, _ = _metadata(obj)
+            with self.lock:
+                if etype == "DELETED":
+                    self._remove((namespace, name))
+                    self._add_tombstone(obj)
+                else:
+                    self._store(obj)
+            self._notify(namespace, name)
+            if self.stop_event.is_set():
+                break
+        return rv
+
+    def run(self) -> None:
+        rv = None
+        last_list = 0.0
+        while not self.stop_event.is_set():
+            try:
+                if rv is None or time.monotonic() - last_list > k_relist_interval:
+                    rv = self._list()
+                    last_list = time.monotonic()
+                rv = self._watch(rv)
+            except ApiException as e:
+                if e.status != 410:
+                    print(f"Informer {self.kind}: error watching: {e}")
+                    self.stop_event.wait(k_retry_delay)
+                rv = None
+            except Exception as e:
+                print(f"Informer {self.kind}: error watching: {e}")
+                self.stop_event.wait(k_retry_delay)
+                rv = None
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self.watch:
+            self.watch.stop()
+
+
+def _cluster_label(obj: Any) -> Optional[str]:
+    return _metadata(obj)[3].get("mysql.oracle.com/cluster")
+
+
+g_pods = Informer("pods", api_core.list_pod_for_all_namespaces,
+                  list_kwargs={"label_selector": "component=mysqld"},
+                  indexes={"cluster": _cluster_label}, raw=True)
+
+def _cluster_tls_secrets(obj: Any) -> List[str]:
+    # same defaults as InnoDBClusterSpec
+    name = obj["metadata"]["name"]
+    spec = obj.get("spec") or {}
+    router = spec.get("router") or {}
+    return [spec.get("tlsCASecretName") or f"{name}-ca",
+            router.get("tlsSecretName") or f"{name}-router-tls"]
+
+
+g_clusters = Informer("innodbclusters", api_customobj.list_cluster_custom_object,
+                      list_args=(consts.GROUP, consts.VERSION,
+                                 consts.INNODBCLUSTER_PLURAL),
+                      indexes={"tls-secret": _cluster_tls_secrets})
+
+g_stateful_sets = Informer("statefulsets",
+                           api_apps.list_stateful_set_for_all_namespaces,
+                           list_kwargs={"label_selector": "mysql.oracle.com/cluster"})
+
+# router Deployments created by older versions have no labels (they were
+# set under metadata.label), readers fall back to the API for those
+g_deployments = Informer("deployments",
+                         api_apps.list_deployment_for_all_namespaces,
+                         list_kwargs={"label_selector": "mysql.oracle.com/cluster"},
+                         keep=owned_by_cluster)
+
+# Only the account Secrets the operator creates carry the cluster label.
+# Secrets created by older versions don't, readers fall back to the API
+# for those.
+g_secrets = Informer("secrets", api_core.list_secret_for_all_namespaces,
+                     list_kwargs={"label_selector": "mysql.oracle.com/cluster"},
+                     keep=owned_by_cluster)
+
+_all_informers = [g_pods, g_clusters, g_stateful_sets, g_deployments, g_secrets]
+
+
+def start_informers() -> None:
+    if not k_informers_enabled:
+        return
+    for informer in _all_informers:
+        informer.start()
+
+
+def stop_informers() -> None:
+    for informer in _all_informers:
+        informer.stop()
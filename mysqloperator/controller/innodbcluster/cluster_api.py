@@ -9,18 +9,145 @@ from typing import Optional, List, Tuple, cast, overload
 from kopf.structs.bodies import Body
 
 from ..k8sobject import K8sInterfaceObject
-from .. import utils, config, consts
+from .. import utils, config, consts, informer
 from ..backup.backup_api import BackupProfile, BackupSchedule
 from ..storage_api import StorageSpec
 from ..api_utils import Edition, dget_bool, dget_dict, dget_enum, dget_str, dget_int, dget_list, ApiSpecError, ImagePullPolicy
 from ..kubeutils import api_core, api_apps, api_customobj, api_policy, api_rbac, api_batch, api_cron_job
 from ..kubeutils import client as api_client, ApiException
 from logging import Logger
+from contextlib import contextmanager
+import collections
+import copy
+import functools
 import json
 import yaml
 import datetime
+import os
+import threading
+import time
 from kubernetes import client
 
+# Status updates that only change timestamps (like lastProbeTime) are written
+# at most once every this many seconds per cluster
+k_status_heartbeat = int(os.getenv("MYSQL_OPERATOR_STATUS_HEARTBEAT", default="60"))
+k_status_timestamp_fields = ("lastProbeTime",)
+
+# Attempts to write the status when it's changed by someone else at the same time
+k_status_write_attempts = 5
+
+# Per cluster (by uid, so that a recreated cluster starts over): time of the
+# last status write and the timestamps that would have been written since
+g_status_state = utils.EphemeralState()
+
+# Number of parsed pod membership-info annotations to keep
+k_membership_info_cache_size = 1024
+
+# Number of parsed cluster specs to keep
+k_spec_cache_size = 256
+
+# Max age of cached account credentials when there's no Secret informer
+# to tell when they change (seconds)
+k_credential_cache_ttl = int(os.getenv("MYSQL_OPERATOR_CREDENTIAL_CACHE_TTL", default="300"))
+
+
+def _merge_status(base: dict, changes: dict) -> dict:
+    """Apply changes to base the same way a JSON merge patch would"""
+    result = dict(base)
+    for k, v in changes.items():
+        if v is None:
+            result.pop(k, None)
+        elif isinstance(v, dict) and isinstance(result.get(k), dict):
+            result[k] = _merge_status(result[k], v)
+        else:
+            result[k] = v
+    return result
+
+
+def _strip_timestamps(status: dict) -> dict:
+    return {k: _strip_timestamps(v) if isinstance(v, dict) else v
+            for k, v in status.items() if k not in k_status_timestamp_fields}
+
+
+def _only_timestamps(status: dict) -> dict:
+    """The fields _strip_timestamps() removes, with the dicts containing them"""
+    result = {}
+    for k, v in status.items():
+        if k in k_status_timestamp_fields:
+            result[k] = v
+        elif isinstance(v, dict):
+            nested = _only_timestamps(v)
+            if nested:
+                result[k] = nested
+    return result
+
+
+def _read_json(api_func, *args, **kwargs) -> dict:
+    """Call an API function, returning the response as a dict instead of a model"""
+    return json.loads(api_func(*args, _preload_content=False, **kwargs).data)
+
+
+@functools.lru_cache(maxsize=k_membership_info_cache_size)
+def _parse_membership_info(uid: str, resource_version: str, info: str) -> dict:
+    # the membership-info annotation of a pod only changes with its
+    # resourceVersion, so it's parsed once per version
+    return json.loads(info)
+
+
+class CredentialCache:
+    """
+    Decoded contents of the account Secrets of clusters, keyed by namespace
+    and Secret name and valid for the resourceVersion they were read from.
+    Entries are dropped on Secret watch events and, when informers are not
+    running, expire after k_credential_cache_ttl.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: typing.Dict[Tuple[str, str],
+                                  Tuple[Optional[str], float, typing.Dict[str, str]]] = {}
+
+    def get_account(self, namespace: str, name: str,
+                    user_key: str, password_key: str) -> Tuple[str, str]:
+        data = self._get(namespace, name)
+        return data[user_key], data[password_key]
+
+    def _get(self, namespace: str, name: str) -> typing.Dict[str, str]:
+        secret = informer.g_secrets.get(namespace, name)
+        with self.lock:
+            entry = self.entries.get((namespace, name))
+        if entry:
+            rv, since, data = entry
+            if secret is not None:
+                if secret.metadata.resource_version == rv:
+                    return data
+            elif time.monotonic() - since < k_credential_cache_ttl:
+                return data
+
+        if secret is None:
+            secret = api_core.read_namespaced_secret(name, namespace)
+        data = {k: utils.b64decode(v) for k, v in (secret.data or {}).items()}
+        with self.lock:
+            self.entries[(namespace, name)] = (secret.metadata.resource_version,
+                                               time.monotonic(), data)
+        return data
+
+    def invalidate(self, namespace: Optional[str], name: Optional[str]) -> None:
+        with self.lock:
+            if namespace is None:
+                self.entries.clear()
+            else:
+                self.entries.pop((namespace, name), None)
+
+
+g_credential_cache = CredentialCache()
+informer.g_secrets.add_listener(g_credential_cache.invalidate)
+
+
+def get_cluster_admin_account(namespace: str, cluster_name: str) -> Tuple[str, str]:
+    return g_credential_cache.get_account(namespace, f"{cluster_name}-privsecrets",
+                                          "clusterAdminUsername", "clusterAdminPassword")
+
 
 MAX_CLUSTER_NAME_LEN = 28
 
@@ -166,17 +293,9 @@ class InnoDBClusterSpec:
     # override pod template for MySQL (optional)
     podSpec: dict = {}
 
-    # Initialize DB
-    initDB: Optional[InitDB] = None
-
-    router: RouterSpec = RouterSpec()
-
     # TODO resource allocation for server, router and sidecar
     # TODO recommendation is that sidecar has 500MB RAM if MEB is used
 
-    # Backup info
-    backupProfiles: List[BackupProfile] = []
-
     # (currently) non-configurable constants
     mysql_port: int = 3306
     mysql_xport: int = 33060
@@ -191,10 +310,17 @@ class InnoDBClusterSpec:
     def __init__(self, namespace: str, name: str, spec: dict):
         self.namespace = namespace
         self.name = name
-        self.backupSchedules: List[BackupSchedule] = []
         self.load(spec)
 
     def load(self, spec: dict) -> None:
+        # router, initDB and backup subsections are only parsed when used
+        self._spec = copy.deepcopy(dict(spec))
+        self._router: Optional[RouterSpec] = None
+        self._initDB: Optional[InitDB] = None
+        self._initDB_parsed = False
+        self._backupProfiles: Optional[List[BackupProfile]] = None
+        self._backupSchedules: Optional[List[BackupSchedule]] = None
+
         self.secretName = dget_str(spec, "secretName", "spec")
 
         if "tlsCASecretName" in spec:
@@ -249,37 +375,48 @@ class InnoDBClusterSpec:
         if "mycnf" in spec:
             self.mycnf = dget_str(spec, "mycnf", "spec")
 
-        # Router Options
-        if "router" in spec:
-            self.router = RouterSpec()
-            self.router.parse(dget_dict(spec, "router", "spec"), "spec.router")
-        else:
-            self.router = RouterSpec()
-
-        if not self.router.tlsSecretName:
-            self.router.tlsSecretName = f"{self.name}-router-tls"
-
-        # Initialization Options
-        if "initDB" in spec:
-            self.load_initdb(dget_dict(spec, "initDB", "spec"))
-
         # TODO keep a list of base_server_id in the operator to keep things globally unique?
         if "baseServerId" in spec:
             self.baseServerId = dget_int(spec, "baseServerId", "spec")
 
+    # Router Options
+    @property
+    def router(self) -> RouterSpec:
+        if self._router is None:
+            router = RouterSpec()
+            if "router" in self._spec:
+                router.parse(dget_dict(self._spec, "router", "spec"), "spec.router")
+
+            if not router.tlsSecretName:
+                router.tlsSecretName = f"{self.name}-router-tls"
+            self._router = router
+        return self._router
+
+    # Initialization Options
+    @property
+    def initDB(self) -> Optional[InitDB]:
+        if not self._initDB_parsed:
+            if "initDB" in self._spec:
+                self.load_initdb(dget_dict(self._spec, "initDB", "spec"))
+            self._initDB_parsed = True
+        return self._initDB
 
-        self.backupProfiles = []
-        if "backupProfiles" in spec:
-            profiles = dget_list(spec, "backupProfiles", "spec", [], content_type=dict)
-            for profile in profiles:
-                self.backupProfiles.append(self.parse_backup_profile(profile))
-
+    # Backup info
+    @property
+    def backupProfiles(self) -> List[BackupProfile]:
+        if self._backupProfiles is None:
+            profiles = dget_list(self._spec, "backupProfiles", "spec", [], content_type=dict)
+            self._backupProfiles = [self.parse_backup_profile(profile)
+                                    for profile in profiles]
+        return self._backupProfiles
 
-        self.backupSchedules = []
-        if "backupSchedules" in spec:
-            schedules = dget_list(spec, "backupSchedules", "spec", [], content_type=dict)
-            for schedule in schedules:
-                self.backupSchedules.append(self.parse_backup_schedule(schedule))
+    @property
+    def backupSchedules(self) -> List[BackupSchedule]:
+        if self._backupSchedules is None:
+            schedules = dget_list(self._spec, "backupSchedules", "spec", [], content_type=dict)
+            self._backupSchedules = [self.parse_backup_schedule(schedule)
+                                     for schedule in schedules]
+        return self._backupSchedules
 
     def parse_backup_profile(self, spec: dict) -> BackupProfile:
         profile = BackupProfile()
@@ -292,8 +429,9 @@ class InnoDBClusterSpec:
         return schedule
 
     def load_initdb(self, spec: dict) -> None:
-        self.initDB = InitDB()
-        self.initDB.parse(spec, "spec.initDB")
+        initDB = InitDB()
+        initDB.parse(spec, "spec.initDB")
+        self._initDB = initDB
 
     def get_backup_profile(self, name: str) -> Optional[BackupProfile]:
         if self.backupProfiles:
@@ -305,6 +443,9 @@ class InnoDBClusterSpec:
     def validate(self, logger: Logger) -> None:
         # TODO see if we can move some of these to a schema in the CRD
 
+        # parse the subsections now, to report errors in them
+        _ = (self.router, self.initDB, self.backupProfiles, self.backupSchedules)
+
         if len(self.name) > MAX_CLUSTER_NAME_LEN:
             raise ApiSpecError(
                 f"Cluster name {self.name} is too long. Must be < {MAX_CLUSTER_NAME_LEN}")
@@ -508,12 +649,43 @@ class InnoDBClusterSpec:
 
 
 
+# Parsed specs shared by all handlers, keyed by cluster (uid, generation).
+# The generation only changes when the spec does.
+_spec_cache: "collections.OrderedDict[Tuple[str, int], InnoDBClusterSpec]" = collections.OrderedDict()
+_spec_cache_lock = threading.Lock()
+
+
+def get_parsed_spec(namespace: str, name: str, uid: Optional[str],
+                    generation: Optional[int], spec: dict) -> InnoDBClusterSpec:
+    """
+    Return the parsed spec of a cluster, parsing it only if this generation
+    of the cluster wasn't parsed before.
+    """
+    if not uid or generation is None:
+        return InnoDBClusterSpec(namespace, name, spec)
+
+    key = (uid, generation)
+    with _spec_cache_lock:
+        parsed = _spec_cache.get(key)
+        if parsed:
+            _spec_cache.move_to_end(key)
+            return parsed
+
+    parsed = InnoDBClusterSpec(namespace, name, spec)
+    with _spec_cache_lock:
+        _spec_cache[key] = parsed
+        while len(_spec_cache) > k_spec_cache_size:
+            _spec_cache.popitem(last=False)
+    return parsed
+
+
 class InnoDBCluster(K8sInterfaceObject):
     def __init__(self, cluster: Body) -> None:
         super().__init__()
 
         self.obj: Body = cluster
         self._parsed_spec: Optional[InnoDBClusterSpec] = None
+        self._status_batch: Optional[dict] = None
 
     def __str__(self):
         return f"{self.namespace}/{self.name}"
@@ -522,7 +694,12 @@ class InnoDBCluster(K8sInterfaceObject):
         return f"<InnoDBCluster {self.name}>"
 
     @classmethod
-    def _get(cls, ns: str, name: str) -> Body:
+    def _get(cls, ns: str, name: str, cached: bool = True) -> Body:
+        if cached:
+            obj = informer.g_clusters.get(ns, name)
+            if obj is not None:
+                return cast(Body, copy.deepcopy(obj))
+
         try:
             ret = cast(Body,
                         api_customobj.get_namespaced_custom_object(
@@ -535,15 +712,19 @@ class InnoDBCluster(K8sInterfaceObject):
 
     @classmethod
     def _patch(cls, ns: str, name: str, patch: dict) -> Body:
-        return cast(Body, api_customobj.patch_namespaced_custom_object(
+        obj = cast(Body, api_customobj.patch_namespaced_custom_object(
             consts.GROUP, consts.VERSION, ns,
             consts.INNODBCLUSTER_PLURAL, name, body=patch))
+        informer.g_clusters.update(copy.deepcopy(obj))
+        return obj
 
     @classmethod
     def _patch_status(cls, ns: str, name: str, patch: dict) -> Body:
-        return cast(Body, api_customobj.patch_namespaced_custom_object_status(
+        obj = cast(Body, api_customobj.patch_namespaced_custom_object_status(
             consts.GROUP, consts.VERSION, ns,
             consts.INNODBCLUSTER_PLURAL, name, body=patch))
+        informer.g_clusters.update(copy.deepcopy(obj))
+        return obj
 
     @classmethod
     def read(cls, ns: str, name: str) -> 'InnoDBCluster':
@@ -605,29 +786,35 @@ class InnoDBCluster(K8sInterfaceObject):
         return self._parsed_spec
 
     def parse_spec(self) -> None:
-        self._parsed_spec = InnoDBClusterSpec(self.namespace, self.name, self.spec)
+        self._parsed_spec = get_parsed_spec(
+            self.namespace, self.name, self.metadata.get("uid"),
+            self.metadata.get("generation"), self.spec)
 
     def reload(self) -> None:
         self.obj = self._get(self.namespace, self.name)
 
     def owns_pod(self, pod) -> bool:
         owner_sts = pod.owner_reference("apps/v1", "StatefulSet")
-        return owner_sts.name == self.name
+        return owner_sts["name"] == self.name
 
     def get_pod(self, index) -> 'MySQLPod':
-        pod = cast(api_client.V1Pod, api_core.read_namespaced_pod(
-            "%s-%i" % (self.name, index), self.namespace))
+        name = "%s-%i" % (self.name, index)
+        pod = informer.g_pods.get(self.namespace, name)
+        if pod is None:
+            pod = _read_json(api_core.read_namespaced_pod, name, self.namespace)
         return MySQLPod(pod)
 
     def get_pods(self) -> typing.List['MySQLPod']:
         # get all pods that belong to the same container
-        objects = cast(api_client.V1PodList, api_core.list_namespaced_pod(
-            self.namespace, label_selector="component=mysqld"))
+        items = informer.g_pods.list_indexed("cluster", self.namespace, self.name)
+        if items is None:
+            items = _read_json(api_core.list_namespaced_pod, self.namespace,
+                               label_selector="component=mysqld")["items"]
 
         pods = []
 
         # Find the MySQLServer object corresponding to the server we're attached to
-        for o in objects.items:
+        for o in items:
             pod = MySQLPod(o)
             if self.owns_pod(pod):
                 pods.append(pod)
@@ -655,6 +842,9 @@ class InnoDBCluster(K8sInterfaceObject):
             raise
 
     def get_stateful_set(self) -> typing.Optional[api_client.V1StatefulSet]:
+        sts = informer.g_stateful_sets.get(self.namespace, self.name)
+        if sts is not None:
+            return cast(api_client.V1StatefulSet, sts)
         try:
             return cast(api_client.V1StatefulSet,
                         api_apps.read_namespaced_stateful_set(self.name, self.namespace))
@@ -673,6 +863,9 @@ class InnoDBCluster(K8sInterfaceObject):
             raise
 
     def get_router_deployment(self) -> typing.Optional[api_client.V1Deployment]:
+        deployment = informer.g_deployments.get(self.namespace, self.name+"-router")
+        if deployment is not None:
+            return cast(api_client.V1Deployment, deployment)
         try:
             return cast(api_client.V1Deployment,
                         api_apps.read_namespaced_deployment(self.name+"-router", self.namespace))
@@ -693,22 +886,22 @@ class InnoDBCluster(K8sInterfaceObject):
 
         return get_cron_job_inner
 
-    def get_router_account(self) -> Tuple[str, str]:
-        secret = cast(api_client.V1Secret, api_core.read_namespaced_secret(
-            f"{self.name}-router", self.namespace))
+    def _read_secret(self, name: str) -> api_client.V1Secret:
+        secret = informer.g_secrets.get(self.namespace, name)
+        if secret is None:
+            secret = api_core.read_namespaced_secret(name, self.namespace)
+        return cast(api_client.V1Secret, secret)
 
-        return utils.b64decode(secret.data["routerUsername"]), utils.b64decode(secret.data["routerPassword"])
+    def get_router_account(self) -> Tuple[str, str]:
+        return g_credential_cache.get_account(self.namespace, f"{self.name}-router",
+                                              "routerUsername", "routerPassword")
 
     def get_backup_account(self) -> Tuple[str, str]:
-        secret = cast(api_client.V1Secret,
-                      api_core.read_namespaced_secret(
-                          f"{self.name}-backup", self.namespace))
-
-        return utils.b64decode(secret.data["backupUsername"]), utils.b64decode(secret.data["backupPassword"])
+        return g_credential_cache.get_account(self.namespace, f"{self.name}-backup",
+                                              "backupUsername", "backupPassword")
 
     def get_private_secrets(self) -> api_client.V1Secret:
-        return cast(api_client.V1Secret,
-                    api_core.read_namespaced_secret(f"{self.name}-privsecrets", self.namespace))
+        return self._read_secret(f"{self.name}-privsecrets")
 
     def get_user_secrets(self) -> typing.Optional[api_client.V1Secret]:
         name = self.spec.get("secretName")
@@ -721,10 +914,7 @@ class InnoDBCluster(K8sInterfaceObject):
             raise
 
     def get_admin_account(self) -> Tuple[str, str]:
-        secrets = self.get_private_secrets()
-
-        return (utils.b64decode(secrets.data["clusterAdminUsername"]),
-                utils.b64decode(secrets.data["clusterAdminPassword"]))
+        return get_cluster_admin_account(self.namespace, self.name)
 
     def get_service_account(self) -> api_client.V1ServiceAccount:
         return cast(api_client.V1ServiceAccount,
@@ -753,17 +943,96 @@ class InnoDBCluster(K8sInterfaceObject):
             raise
 
     def _get_status_field(self, field: str) -> typing.Any:
-        return cast(str, self.status.get(field))
+        if self._status_batch and field in self._status_batch:
+            return self._status_batch[field]
+        value = self.status.get(field)
+        unwritten = g_status_state.get(self, f"{self.uid}/unwritten-timestamps")
+        if unwritten and field in unwritten:
+            if isinstance(value, dict):
+                return _merge_status(value, unwritten[field])
+            return unwritten[field]
+        return cast(str, value)
+
+    def forget_status_state(self) -> None:
+        """Drop the status write bookkeeping, once the cluster is deleted"""
+        g_status_state.clear(self, f"{self.uid}/last-status-write")
+        g_status_state.clear(self, f"{self.uid}/unwritten-timestamps")
 
     def _set_status_field(self, field: str, value: typing.Any) -> None:
-        obj = self._get(self.namespace, self.name)
+        self._update_status({field: value})
 
-        if "status" not in obj:
-            patch = {"status": {}}
+    @contextmanager
+    def status_batch(self) -> typing.Iterator[None]:
+        """
+        Accumulate the status changes made in the block and write them with
+        a single patch at the end, even if the block raises an exception.
+        """
+        if self._status_batch is not None:
+            yield
+            return
+
+        self._status_batch = {}
+        try:
+            yield
+        finally:
+            changes, self._status_batch = self._status_batch, None
+            if changes:
+                self._write_status(changes)
+
+    def _update_status(self, changes: dict) -> None:
+        if self._status_batch is not None:
+            self._status_batch = _merge_status(self._status_batch, changes)
         else:
-            patch = {"status": obj["status"]}
-        patch["status"][field] = value
-        self.obj = self._patch_status(self.namespace, self.name, patch)
+            self._write_status(changes)
+
+    def _write_status(self, changes: dict) -> None:
+        """
+        Merge changes into the status. Nothing is written if the status
+        wouldn't change, or if only timestamps would change and the status
+        was written less than k_status_heartbeat seconds ago, as long as a
+        fresh read of the object agrees.
+        """
+        obj = self._get(self.namespace, self.name)
+        fresh = False
+        attempt = 0
+        while True:
+            current = obj.get("status") or {}
+            status = _merge_status(current, changes)
+            skip = status == current
+            if not skip:
+                last_write = g_status_state.get(self, f"{self.uid}/last-status-write")
+                skip = (last_write and time.monotonic() - last_write < k_status_heartbeat
+                        and _strip_timestamps(status) == _strip_timestamps(current))
+            if skip and not fresh:
+                # the cached object may be stale, only skip the write if the
+                # current object agrees
+                obj = self._get(self.namespace, self.name, cached=False)
+                fresh = True
+                continue
+            if skip:
+                if status != current:
+                    g_status_state.set(self, f"{self.uid}/unwritten-timestamps",
+                                       _only_timestamps(status))
+                self.obj = obj
+                return
+
+            # fail instead of overwriting changes made by someone else since
+            # we read the object
+            patch = {"metadata": {"resourceVersion": obj["metadata"]["resourceVersion"]},
+                     "status": changes}
+            try:
+                self.obj = self._patch_status(self.namespace, self.name, patch)
+            except ApiException as e:
+                attempt += 1
+                if e.status != 409 or attempt == k_status_write_attempts:
+                    raise
+                obj = self._get(self.namespace, self.name, cached=False)
+                fresh = True
+                continue
+
+            g_status_state.set(self, f"{self.uid}/last-status-write", time.monotonic())
+            g_status_state.set(self, f"{self.uid}/unwritten-timestamps", None)
+            return
 
     def set_cluster_status(self, cluster_status) -> None:
         self._set_status_field("cluster", cluster_status)
@@ -775,13 +1044,7 @@ class InnoDBCluster(K8sInterfaceObject):
         return status
 
     def set_status(self, status) -> None:
-        obj = cast(dict, self._get(self.namespace, self.name))
-
-        if "status" not in obj:
-            obj["status"] = status
-        else:
-            obj["status"] = utils.merge_patch_object(obj["status"], status)
-        self.obj = self._patch_status(self.namespace, self.name, obj)
+        self._update_status(status)
 
     def update_cluster_info(self, info: dict) -> None:
         """
@@ -929,6 +1192,10 @@ class InnoDBCluster(K8sInterfaceObject):
 
 
 def get_all_clusters(ns: str = None) -> typing.List[InnoDBCluster]:
+    items = informer.g_clusters.list(ns)
+    if items is not None:
+        return [InnoDBCluster(copy.deepcopy(o)) for o in items]
+
     if ns is None:
         objects = cast(dict, api_customobj.list_cluster_custom_object(
             consts.GROUP, consts.VERSION, consts.INNODBCLUSTER_PLURAL))
@@ -938,13 +1205,30 @@ def get_all_clusters(ns: str = None) -> typing.List[InnoDBCluster]:
     return [InnoDBCluster(o) for o in objects["items"]]
 
 
+def get_clusters_using_tls_secret(ns: str, name: str) -> typing.List[InnoDBCluster]:
+    """Clusters in ns that use the named Secret as TLS CA or router certificate"""
+    items = informer.g_clusters.list_indexed("tls-secret", ns, name)
+    if items is not None:
+        return [InnoDBCluster(copy.deepcopy(o)) for o in items]
+    return get_all_clusters(ns)
+
+
 class MySQLPod(K8sInterfaceObject):
+    """
+    View over a pod object in its JSON form (as received from kopf or read
+    from the API), reading fields only when they're accessed.
+    """
+
+    __slots__ = ("pod", "port", "xport", "admin_account")
+
     logger: Optional[Logger] = None
 
-    def __init__(self, pod: client.V1Pod):
+    def __init__(self, pod: typing.Union[dict, client.V1Pod]):
         super().__init__()
 
-        self.pod: client.V1Pod = pod
+        if isinstance(pod, client.V1Pod):
+            pod = api_core.api_client.sanitize_for_serialization(pod)
+        self.pod: dict = pod
 
         self.port = 3306
         self.xport = 33060
@@ -963,15 +1247,10 @@ class MySQLPod(K8sInterfaceObject):
 
     @classmethod
     def from_json(cls, pod) -> 'MySQLPod':
-        class Wrapper:
-            def __init__(self, data):
-                self.data = json.dumps(data)
-
-        if not isinstance(pod, str):
-            pod = eval(str(pod))
-
-        return MySQLPod(cast(client.V1Pod, api_core.api_client.deserialize(
-            Wrapper(pod), client.V1Pod)))
+        if isinstance(pod, str):
+            return MySQLPod(json.loads(pod))
+        # kopf gives each event its own body, so a shallow copy is enough
+        return MySQLPod(dict(pod))
 
     def __str__(self) -> str:
         return self.name
@@ -981,45 +1260,44 @@ class MySQLPod(K8sInterfaceObject):
 
     @classmethod
     def read(cls, name: str, ns: str) -> 'MySQLPod':
-        return MySQLPod(cast(client.V1Pod,
-                             api_core.read_namespaced_pod(name, ns)))
+        return MySQLPod(_read_json(api_core.read_namespaced_pod, name, ns))
 
     @property
-    def metadata(self) -> api_client.V1ObjectMeta:
-        return cast(api_client.V1ObjectMeta, self.pod.metadata)
+    def metadata(self) -> dict:
+        return self.pod["metadata"]
 
     def self_ref(self, field_path: Optional[str] = None) -> dict:
         ref = {
-            "apiVersion": self.pod.api_version,
-            "kind": self.pod.kind,
+            "apiVersion": self.pod.get("apiVersion", "v1"),
+            "kind": self.pod.get("kind", "Pod"),
             "name": self.name,
             "namespace": self.namespace,
-            "resourceVersion": self.metadata.resource_version,
-            "uid": self.metadata.uid
+            "resourceVersion": self.metadata.get("resourceVersion"),
+            "uid": self.metadata.get("uid")
         }
         if field_path:
             ref["fieldPath"] = field_path
         return ref
 
     @property
-    def status(self) -> api_client.V1PodStatus:
-        return cast(api_client.V1PodStatus, self.pod.status)
+    def status(self) -> dict:
+        return self.pod.get("status") or {}
 
     @property
     def phase(self) -> str:
-        return cast(str, self.status.phase)
+        return cast(str, self.status.get("phase"))
 
     @property
     def deleting(self) -> bool:
-        return self.metadata.deletion_timestamp is not None
+        return self.metadata.get("deletionTimestamp") is not None
 
     @property
-    def spec(self) -> api_client.V1PodSpec:
-        return cast(api_client.V1PodSpec, self.pod.spec)
+    def spec(self) -> dict:
+        return self.pod.get("spec") or {}
 
     @property
     def name(self) -> str:
-        return cast(str, self.metadata.name)
+        return cast(str, self.metadata["name"])
 
     @property
     def index(self) -> int:
@@ -1027,7 +1305,7 @@ class MySQLPod(K8sInterfaceObject):
 
     @property
     def namespace(self) -> str:
-        return cast(str, self.metadata.namespace)
+        return cast(str, self.metadata["namespace"])
 
     @property
     def cluster_name(self) -> str:
@@ -1035,15 +1313,15 @@ class MySQLPod(K8sInterfaceObject):
 
     @property
     def address(self) -> str:
-        return self.name+"."+cast(str, self.spec.subdomain)
+        return self.name+"."+cast(str, self.spec.get("subdomain"))
 
     @property
     def address_fqdn(self) -> str:
-        return self.name+"."+cast(str, self.spec.subdomain)+"."+self.namespace+".svc.cluster.local"
+        return self.name+"."+cast(str, self.spec.get("subdomain"))+"."+self.namespace+".svc.cluster.local"
 
     @property
     def pod_ip_address(self) -> str:
-        return self.pod.status.pod_ip
+        return self.status.get("podIP")
 
     @property
     def endpoint(self) -> str:
@@ -1056,7 +1334,8 @@ class MySQLPod(K8sInterfaceObject):
     @property
     def endpoint_co(self) -> dict:
         if not self.admin_account:
-            self.admin_account = self.get_cluster().get_admin_account()
+            self.admin_account = get_cluster_admin_account(
+                self.namespace, self.cluster_name)
 
         return {"scheme": "mysql",
                 "user": self.admin_account[0],
@@ -1067,7 +1346,8 @@ class MySQLPod(K8sInterfaceObject):
     @property
     def endpoint_url_safe(self) -> dict:
         if not self.admin_account:
-            self.admin_account = self.get_cluster().get_admin_account()
+            self.admin_account = get_cluster_admin_account(
+                self.namespace, self.cluster_name)
 
         return {"scheme": "mysql",
                 "user": self.admin_account[0],
@@ -1078,7 +1358,8 @@ class MySQLPod(K8sInterfaceObject):
     @property
     def xendpoint_co(self) -> dict:
         if not self.admin_account:
-            self.admin_account = self.get_cluster().get_admin_account()
+            self.admin_account = get_cluster_admin_account(
+                self.namespace, self.cluster_name)
 
         return {"scheme": "mysqlx",
                 "user": self.admin_account[0],
@@ -1087,12 +1368,12 @@ class MySQLPod(K8sInterfaceObject):
                 "port": self.xport}
 
     def reload(self) -> None:
-        self.pod = cast(api_client.V1Pod, api_core.read_namespaced_pod(
-            self.name, self.namespace))
+        self.pod = _read_json(api_core.read_namespaced_pod,
+                              self.name, self.namespace)
 
-    def owner_reference(self, api_version, kind) -> typing.Optional[api_client.V1OwnerReference]:
-        for owner in self.metadata.owner_references:
-            if owner.api_version == api_version and owner.kind == kind:
+    def owner_reference(self, api_version, kind) -> typing.Optional[dict]:
+        for owner in self.metadata.get("ownerReferences") or []:
+            if owner.get("apiVersion") == api_version and owner.get("kind") == kind:
                 return owner
 
         return None
@@ -1108,10 +1389,9 @@ class MySQLPod(K8sInterfaceObject):
             raise
 
     def check_condition(self, cond_type: str) -> typing.Optional[bool]:
-        if self.status and self.status.conditions:
-            for c in self.status.conditions:
-                if c.type == cond_type:
-                    return c.status == "True"
+        for c in self.status.get("conditions") or []:
+            if c.get("type") == cond_type:
+                return c.get("status") == "True"
 
         return None
 
@@ -1119,17 +1399,15 @@ class MySQLPod(K8sInterfaceObject):
         return self.check_condition("ContainersReady")
 
     def check_container_ready(self, container_name: str) -> typing.Optional[bool]:
-        if self.status.container_statuses:
-            for cs in self.status.container_statuses:
-                if cs.name == container_name:
-                    return cs.ready
+        for cs in self.status.get("containerStatuses") or []:
+            if cs.get("name") == container_name:
+                return cs.get("ready")
         return None
 
     def get_container_restarts(self, container_name: str) -> typing.Optional[int]:
-        if self.status.container_statuses:
-            for cs in self.status.container_statuses:
-                if cs.name == container_name:
-                    return cs.restart_count
+        for cs in self.status.get("containerStatuses") or []:
+            if cs.get("name") == container_name:
+                return cs.get("restartCount")
         return None
 
     def get_member_readiness_gate(self, gate: str) -> typing.Optional[bool]:
@@ -1151,19 +1429,20 @@ class MySQLPod(K8sInterfaceObject):
                 "lastTransitionTime": '%s' % now if changed else None
             }]}}
 
-        self.pod = cast(api_client.V1Pod, api_core.patch_namespaced_pod_status(
-            self.name, self.namespace, body=patch))
+        self.pod = _read_json(api_core.patch_namespaced_pod_status,
+                              self.name, self.namespace, body=patch)
+        informer.g_pods.update(self.pod)
 
     # TODO remove field
     def get_membership_info(self, field: str = None) -> typing.Optional[dict]:
-        if self.metadata.annotations:
-            info = self.metadata.annotations.get(
-                "mysql.oracle.com/membership-info", None)
-            if info:
-                info = json.loads(info)
-                if info and field:
-                    return info.get(field)
-                return info
+        info = (self.metadata.get("annotations") or {}).get(
+            "mysql.oracle.com/membership-info", None)
+        if info:
+            info = _parse_membership_info(
+                self.metadata.get("uid"), self.metadata.get("resourceVersion"), info)
+            if info and field:
+                return info.get(field)
+            return dict(info) if info else info
         return None
 
     def update_membership_status(self, member_id: str, role: str, status: str,
@@ -1200,8 +1479,57 @@ class MySQLPod(K8sInterfaceObject):
                 }
             }
         }
-        self.pod = cast(api_client.V1Pod, api_core.patch_namespaced_pod(
-            self.name, self.namespace, patch))
+        self.pod = _read_json(api_core.patch_namespaced_pod,
+                              self.name, self.namespace, patch)
+        informer.g_pods.update(self.pod)
+
+    def sync_membership_status(self, member_id: str, role: str, status: str,
+                               view_id: str, version: str,
+                               joined: bool = False) -> None:
+        """
+        Like update_membership_status() plus setting the ready gate, but only
+        patching what changed. If only lastProbeTime would change, the pod is
+        left alone until it's k_status_heartbeat seconds old.
+        """
+        info = self.get_membership_info() or {}
+        labels = self.metadata.get("labels") or {}
+        unchanged = (not joined
+                     and info.get("memberId") == member_id
+                     and info.get("role") == role
+                     and info.get("status") == status
+                     and info.get("groupViewId") == view_id
+                     and info.get("version") == version
+                     and labels.get("mysql.oracle.com/cluster-role") == (role if status == "ONLINE" else None))
+        if not unchanged or not self._probed_recently(info.get("lastProbeTime")):
+            self.update_membership_status(
+                member_id, role, status, view_id, version, joined=joined)
+
+        ready = status == "ONLINE"
+        if self.get_member_readiness_gate("ready") != ready:
+            self.update_member_readiness_gate("ready", ready)
+
+    def _probed_recently(self, probe_time: Optional[str]) -> bool:
+        if not probe_time:
+            return False
+        try:
+            t = datetime.datetime.fromisoformat(probe_time.rstrip("Z"))
+        except ValueError:
+            return False
+        return (datetime.datetime.utcnow() - t).total_seconds() < k_status_heartbeat
+
+    def update_cluster_role_label(self, role: Optional[str]) -> None:
+        """
+        Set the cluster-role label alone, skipping the patch if it already
+        has the given value.
+        """
+        labels = self.metadata.get("labels") or {}
+        if labels.get("mysql.oracle.com/cluster-role") == role:
+            return
+
+        patch = {"metadata": {"labels": {"mysql.oracle.com/cluster-role": role}}}
+        self.pod = _read_json(api_core.patch_namespaced_pod,
+                              self.name, self.namespace, patch)
+        informer.g_pods.update(self.pod)
 
     def add_member_finalizer(self) -> None:
         self._add_finalizer("mysql.oracle.com/membership")
@@ -1216,13 +1544,13 @@ class MySQLPod(K8sInterfaceObject):
         removed from the list (remove_finalizer).
         """
         patch = {"metadata": {"finalizers": [fin]}}
-        self.obj = api_core.patch_namespaced_pod(
-            self.name, self.namespace, body=patch)
+        self.pod = _read_json(api_core.patch_namespaced_pod,
+                              self.name, self.namespace, body=patch)
 
     def _remove_finalizer(self, fin: str, pod_body: Body = None) -> None:
         patch = {"metadata": {"$deleteFromPrimitiveList/finalizers": [fin]}}
-        self.obj = api_core.patch_namespaced_pod(
-            self.name, self.namespace, body=patch)
+        self.pod = _read_json(api_core.patch_namespaced_pod,
+                              self.name, self.namespace, body=patch)
 
         if pod_body:
             # modify the JSON data used internally by kopf to update its finalizer list
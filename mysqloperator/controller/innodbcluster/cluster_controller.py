@@ -9,24 +9,54 @@ from .. import consts, errors, kubeutils, shellutils, utils, config, mysqlutils
 from .. import diagnose
 from ..backup import backup_objects
 from ..shellutils import DbaWrap
+from ..gtid import GtidSet
+from ..metrics import g_metrics
+from ..requeue import g_requeue
 from . import router_objects
 from .cluster_api import MySQLPod, InnoDBCluster, client
 import typing
-from typing import Optional, TYPE_CHECKING, Dict
+from typing import Callable, Optional, TYPE_CHECKING, Dict, Tuple, TypeVar
 if TYPE_CHECKING:
     from mysqlsh.mysql import ClassicSession
     from mysqlsh import Dba, Cluster
 import os
 import copy
+import enum
+import itertools
+import threading
 import mysqlsh
 import kopf
 import datetime
 import time
 
+T = TypeVar("T")
+
 MYSQL_OPERATOR_GR_IP_ALLOWLIST_EXTRA = os.getenv("MYSQL_OPERATOR_IP_ALLOWLIST_EXTRA", default="")
 MYSQL_OPERATOR_GR_IP_ALLOWLIST_EXTRA += "," if MYSQL_OPERATOR_GR_IP_ALLOWLIST_EXTRA else ""
 MYSQL_OPERATOR_GR_IP_ALLOWLIST_EXTRA += "127.0.0.1/8,::1/128"
 
+# Handlers that find their cluster busy are queued and run in the background
+# as soon as it's free. kopf calls the handler again after this many seconds
+# to pick up the result.
+k_cluster_busy_retry_delay = float(
+    os.getenv("MYSQL_OPERATOR_CLUSTER_BUSY_RETRY_DELAY", default="5"))
+# Results not picked up within this many seconds are dropped (seconds)
+k_cluster_queue_timeout = float(
+    os.getenv("MYSQL_OPERATOR_CLUSTER_QUEUE_TIMEOUT", default="300"))
+
+_queue_depth = g_metrics.gauge(
+    "mysql_operator_cluster_queue_depth",
+    "Handlers waiting for their turn to work on a cluster")
+_queue_wait = g_metrics.histogram(
+    "mysql_operator_cluster_queue_wait_seconds",
+    "Time handlers waited for their turn to work on a cluster")
+_queue_busy = g_metrics.counter(
+    "mysql_operator_cluster_queue_busy_total",
+    "Handler runs that found the cluster busy and were queued")
+_queue_timeouts = g_metrics.counter(
+    "mysql_operator_cluster_queue_timeouts_total",
+    "Results of queued handlers dropped because they weren't picked up")
+
 common_gr_options = {
     # Abort the server if member is kicked out of the group, which would trigger
     # an event from the container restart, which we can catch and act upon.
@@ -41,24 +71,207 @@ def create_allow_list(pod: MySQLPod, logger) -> str:
 
 
 def select_pod_with_most_gtids(gtids: Dict[int, str]) -> int:
+    gtid_sets = {index: GtidSet.parse(gtid_set) for index, gtid_set in gtids.items()}
     pod_indexes = list(gtids.keys())
-    pod_indexes.sort(key = lambda a: mysqlutils.count_gtids(gtids[a]))
+    pod_indexes.sort(key = lambda a: gtid_sets[a].count())
     return pod_indexes[-1]
 
-class ClusterMutex:
-    def __init__(self, cluster: InnoDBCluster, pod: Optional[MySQLPod] = None):
-        self.cluster = cluster
-        self.pod = pod
+def find_pod_member(pod: MySQLPod, members: list) -> Optional[tuple]:
+    """
+    Find the entry for the given pod in a list of members returned by
+    shellutils.query_members()
+    """
+    info = pod.get_membership_info()
+    if info:
+        pod_member_id = info.get("memberId")
+    else:
+        pod_member_id = None
+
+    for member in members:
+        member_id, role, status, view_id, endpoint, version = member
+        if pod_member_id and member_id == pod_member_id:
+            return member
+        elif endpoint == pod.endpoint:
+            return member
+    return None
+
+
+class WorkPriority(enum.IntEnum):
+    """Order in which handlers waiting for the same cluster get to run"""
+    DELETE = 0
+    FAILURE = 1
+    CHANGE = 2
+    INFO = 3
+
+
+class _Waiter:
+    __slots__ = ("owner", "priority", "seq", "since", "func", "outcome",
+                 "finished_at")
+
+    def __init__(self, owner: str, priority: WorkPriority, seq: int,
+                 func: Callable[[], typing.Any]):
+        self.owner = owner
+        self.priority = priority
+        self.seq = seq
+        self.since = time.monotonic()
+        self.func = func
+        # (True, result) or (False, exception) once run
+        self.outcome: Optional[Tuple[bool, typing.Any]] = None
+        self.finished_at = 0.0
+
+
+class _ClusterQueue:
+    __slots__ = ("owner", "waiters", "finished")
+
+    def __init__(self):
+        self.owner: Optional[str] = None
+        # queued and running work, by owner
+        self.waiters: Dict[str, _Waiter] = {}
+        # work run in the background whose handler hasn't come back for it
+        self.finished: Dict[str, _Waiter] = {}
+
+
+class ClusterWorkQueue:
+    """
+    Runs the work of the handlers of each cluster one at a time.
 
-    def __enter__(self, *args):
-        owner = utils.g_ephemeral_pod_state.testset(
-            self.cluster, "cluster-mutex", self.pod.name if self.pod else self.cluster.name)
-        if owner:
-            raise kopf.TemporaryError(
-                f"{self.cluster.name} busy.  lock_owner={owner}", delay=10)
+    Work that finds the cluster busy is queued and the handler raises a
+    TemporaryError instead of blocking its thread. When the cluster is
+    released, it's handed to the first queued work by priority and then
+    arrival order, which runs right away from the requeue scheduler. The
+    handler gets the outcome when kopf (or the pod event retry) calls it
+    again, without running the work again.
+
+    Owners identify the work of a handler on a cluster, e.g. "pod-event/pod-1".
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clusters: Dict[str, _ClusterQueue] = {}
+        self.seq = itertools.count()
+
+    @staticmethod
+    def _key(cluster: InnoDBCluster) -> str:
+        return f"{cluster.namespace}/{cluster.name}"
+
+    def run(self, cluster: InnoDBCluster, owner: str, priority: WorkPriority,
+            func: Callable[[], T]) -> T:
+        key = self._key(cluster)
+        with self.lock:
+            q = self.clusters.setdefault(key, _ClusterQueue())
+            self._expire(q)
+
+            done = q.finished.pop(owner, None)
+            if done:
+                self._cleanup(key, q)
+                ok, value = done.outcome
+                if ok:
+                    return value
+                raise value
+
+            waiter = q.waiters.get(owner)
+            if waiter:
+                if q.owner != owner:
+                    # still queued, run the latest version of the work
+                    waiter.func = func
+                    waiter.priority = min(waiter.priority, priority)
+                lock_owner = q.owner
+            elif q.owner is None:
+                q.owner = owner
+                _queue_wait.observe(0, priority=priority.name)
+                lock_owner = None
+            else:
+                q.waiters[owner] = _Waiter(owner, priority, next(self.seq), func)
+                _queue_depth.set(len(q.waiters), cluster=key)
+                lock_owner = q.owner
+
+        if lock_owner is None:
+            try:
+                return func()
+            finally:
+                self._release(key)
+
+        _queue_busy.inc(priority=priority.name)
+        raise kopf.TemporaryError(
+            f"{cluster.name} busy, queued.  lock_owner={lock_owner}",
+            delay=k_cluster_busy_retry_delay)
+
+    def _release(self, key: str) -> None:
+        with self.lock:
+            q = self.clusters.get(key)
+            if not q:
+                return
+            q.owner = None
+            queued = [w for w in q.waiters.values() if w.outcome is None]
+            if not queued:
+                self._cleanup(key, q)
+                return
+            waiter = min(queued, key=lambda w: (w.priority, w.seq))
+            # hand the cluster over directly, so nobody can barge in
+            q.owner = waiter.owner
+        _queue_wait.observe(time.monotonic() - waiter.since,
+                            priority=waiter.priority.name)
+        g_requeue.schedule(f"cluster-work/{key}/{waiter.owner}", 0,
+                           lambda: self._run_queued(key, waiter),
+                           kind="cluster-work")
+
+    def _run_queued(self, key: str, waiter: _Waiter) -> None:
+        try:
+            waiter.outcome = (True, waiter.func())
+        except BaseException as e:
+            waiter.outcome = (False, e)
+        finally:
+            with self.lock:
+                q = self.clusters.get(key)
+                if q and q.waiters.get(waiter.owner) is waiter:
+                    del q.waiters[waiter.owner]
+                    waiter.finished_at = time.monotonic()
+                    q.finished[waiter.owner] = waiter
+                    _queue_depth.set(len(q.waiters), cluster=key)
+            self._release(key)
+
+    def discard(self, cluster: InnoDBCluster, owner: Optional[str] = None) -> None:
+        """
+        Drop queued work that is known to be no longer needed, of owner or of
+        the whole cluster (e.g. the pod or cluster was deleted). Pod deletions
+        are kept when the whole cluster goes, they remove the pod finalizers.
+        """
+        key = self._key(cluster)
+        with self.lock:
+            q = self.clusters.get(key)
+            if not q:
+                return
+            for o, w in list(q.waiters.items()):
+                if o == q.owner:
+                    continue
+                if o == owner or (owner is None and w.priority != WorkPriority.DELETE):
+                    del q.waiters[o]
+            for o in list(q.finished):
+                if owner is None or o == owner:
+                    del q.finished[o]
+            _queue_depth.set(len(q.waiters), cluster=key)
+            self._cleanup(key, q)
+
+    def _expire(self, q: _ClusterQueue) -> None:
+        limit = time.monotonic() - k_cluster_queue_timeout
+        for owner, waiter in list(q.finished.items()):
+            if waiter.finished_at < limit:
+                del q.finished[owner]
+                _queue_timeouts.inc(priority=waiter.priority.name)
+
+    def _cleanup(self, key: str, q: _ClusterQueue) -> None:
+        if q.owner is None and not q.waiters and not q.finished:
+            del self.clusters[key]
+            _queue_depth.remove(cluster=key)
 
-    def __exit__(self, *args):
-        utils.g_ephemeral_pod_state.set(self.cluster, "cluster-mutex", None)
+
+g_cluster_queue = ClusterWorkQueue()
+
+
+def run_exclusive(cluster: InnoDBCluster, owner: str, func: Callable[[], T],
+                  priority: WorkPriority = WorkPriority.CHANGE) -> T:
+    """Run func when no other handler is working on the cluster"""
+    return g_cluster_queue.run(cluster, owner, priority, func)
 
 
 class ClusterController:
@@ -92,8 +305,8 @@ class ClusterController:
         }
         self.cluster.set_cluster_status(cluster_status)
 
-    def probe_status(self, logger) -> diagnose.ClusterStatus:
-        diag = diagnose.diagnose_cluster(self.cluster, logger)
+    def probe_status(self, logger, use_cache: bool = True) -> diagnose.ClusterStatus:
+        diag = diagnose.diagnose_cluster(self.cluster, logger, use_cache)
         if not self.cluster.deleting:
             self.publish_status(diag)
         logger.info(
@@ -121,18 +334,34 @@ class ClusterController:
         member_id, role, status, view_id, version, mcount, rmcount = minfo
         logger.debug(
             f"instance probe: role={role} status={status} view_id={view_id} version={version} members={mcount} reachable_members={rmcount}")
-        pod.update_membership_status(
+        pod.sync_membership_status(
             member_id, role, status, view_id, version, joined=joined)
-        # TODO
-        if status == "ONLINE":
-            pod.update_member_readiness_gate("ready", True)
-        else:
-            pod.update_member_readiness_gate("ready", False)
 
         return minfo
 
+    def use_cached_cluster_handle(self, primary_pod: Optional[MySQLPod] = None) -> bool:
+        primary_id = primary_pod.get_membership_info("memberId") if primary_pod else None
+        handle = shellutils.g_cluster_handles.get(self.cluster.uid, primary_id)
+        if handle:
+            self.dba, self.dba_cluster = handle
+            return True
+        return False
+
+    def release_cluster_handle(self, reusable: bool) -> None:
+        """Give the cluster handle back to the cache, for the next pod event"""
+        if self.dba and self.dba_cluster:
+            if reusable:
+                shellutils.g_cluster_handles.put(
+                    self.cluster.uid, self.dba, self.dba_cluster)
+            else:
+                shellutils.g_cluster_handles.invalidate(self.cluster.uid)
+        self.dba = None
+        self.dba_cluster = None
+
     def connect_to_primary(self, primary_pod: MySQLPod, logger) -> 'Cluster':
-        if primary_pod:
+        if self.use_cached_cluster_handle(primary_pod):
+            logger.debug("Reusing cluster handle")
+        elif primary_pod:
             self.dba = shellutils.connect_dba(
                 primary_pod.endpoint_co, logger, max_tries=2)
             self.dba_cluster = self.dba.get_cluster()
@@ -153,7 +382,7 @@ class ClusterController:
                     continue
 
                 try:
-                    self.dba = mysqlsh.connect_dba(pod.endpoint_co)
+                    self.dba = shellutils.pooled_connect_dba(pod.endpoint_co)
                 except Exception as e:
                     logger.debug(f"connect_dba: target={pod.name} error={e}")
                     # Try another pod if we can't connect to it
@@ -365,6 +594,8 @@ class ClusterController:
         logger.info(
             f"Forcing quorum of cluster {self.cluster.name} using {seed_pod.name}...")
 
+        # the cached handle is from before quorum was lost
+        shellutils.g_cluster_handles.invalidate(self.cluster.uid)
         self.connect_to_primary(seed_pod, logger)
 
         self.dba_cluster.force_quorum_using_partition_of(seed_pod.endpoint_co)
@@ -675,8 +906,22 @@ class ClusterController:
         """
         pass
 
+    def invalidate_diagnosis(self) -> None:
+        diagnose.g_diagnosis_cache.invalidate(self.cluster.uid)
+
     def on_pod_created(self, pod: MySQLPod, logger) -> None:
-        diag = self.probe_status(logger)
+        reusable = False
+        try:
+            with self.cluster.status_batch():
+                self._on_pod_created(pod, logger)
+            reusable = True
+        finally:
+            self.release_cluster_handle(reusable)
+            # the pod may have joined or the cluster may have been created
+            self.invalidate_diagnosis()
+
+    def _on_pod_created(self, pod: MySQLPod, logger) -> None:
+        diag = self.probe_status(logger, use_cache=False)
 
         logger.debug(
             f"on_pod_created: pod={pod.name} primary={diag.primary} cluster_state={diag.status}")
@@ -708,7 +953,17 @@ class ClusterController:
                 f"Cluster repair from state {diag.status} attempted", delay=3)
 
     def on_pod_restarted(self, pod: MySQLPod, logger) -> None:
-        diag = self.probe_status(logger)
+        reusable = False
+        try:
+            with self.cluster.status_batch():
+                self._on_pod_restarted(pod, logger)
+            reusable = True
+        finally:
+            self.release_cluster_handle(reusable)
+            self.invalidate_diagnosis()
+
+    def _on_pod_restarted(self, pod: MySQLPod, logger) -> None:
+        diag = self.probe_status(logger, use_cache=False)
         logger.debug(
             f"on_pod_restarted: pod={pod.name}  primary={diag.primary}  cluster_state={diag.status}")
 
@@ -719,7 +974,17 @@ class ClusterController:
             self.reconcile_pod, diag.primary, pod, logger)
 
     def on_pod_deleted(self, pod: MySQLPod, pod_body: Body, logger) -> None:
-        diag = self.probe_status(logger)
+        reusable = False
+        try:
+            with self.cluster.status_batch():
+                self._on_pod_deleted(pod, pod_body, logger)
+            reusable = True
+        finally:
+            self.release_cluster_handle(reusable)
+            self.invalidate_diagnosis()
+
+    def _on_pod_deleted(self, pod: MySQLPod, pod_body: Body, logger) -> None:
+        diag = self.probe_status(logger, use_cache=False)
 
         logger.debug(
             f"on_pod_deleted: pod={pod.name}  primary={diag.primary}  cluster_state={diag.status}")
@@ -741,7 +1006,7 @@ class ClusterController:
                     f"Cluster repair from state {diag.status} attempted", delay=3)
 
         # TODO maybe not needed? need to make sure that shrinking cluster will be reported as ONLINE
-        self.probe_status(logger)
+        self.probe_status(logger, use_cache=False)
 
     def on_group_view_change(self, members: list, view_id_changed) -> None:
         """
@@ -752,26 +1017,25 @@ class ClusterController:
         than in informational k8s fields.
         """
         for pod in self.cluster.get_pods():
-            info = pod.get_membership_info()
-            if info:
-                pod_member_id = info.get("memberId")
-            else:
-                pod_member_id = None
-
-            for member_id, role, status, view_id, endpoint, version in members:
-                if pod_member_id and member_id == pod_member_id:
-                    pass
-                elif endpoint == pod.endpoint:
-                    pass
-                else:
-                    continue
-                pod.update_membership_status(
+            member = find_pod_member(pod, members)
+            if member:
+                member_id, role, status, view_id, endpoint, version = member
+                # only pods whose membership changed are patched
+                pod.sync_membership_status(
                     member_id, role, status, view_id, version)
-                if status == "ONLINE":
-                    pod.update_member_readiness_gate("ready", True)
-                else:
-                    pod.update_member_readiness_gate("ready", False)
-                break
+
+    def on_group_role_change(self, members: list) -> None:
+        """
+        Update the cluster-role label of pods whose role or state changed,
+        e.g. after a new PRIMARY was elected. Only the label is patched, the
+        rest of the membership info is updated by on_group_view_change().
+        """
+        for pod in self.cluster.get_pods():
+            member = find_pod_member(pod, members)
+            if member:
+                member_id, role, status, view_id, endpoint, version = member
+                pod.update_cluster_role_label(
+                    role if status == "ONLINE" else None)
 
     def on_server_image_change(self, version: str) -> None:
         return self.on_upgrade(version = version)
@@ -62,6 +62,9 @@ apiVersion: v1
 kind: Secret
 metadata:
   name: {spec.name}-privsecrets
+  labels:
+    tier: mysql
+    mysql.oracle.com/cluster: {spec.name}
 data:
   clusterAdminUsername: {admin_user}
   clusterAdminPassword: {admin_pwd}
@@ -9,19 +9,20 @@ from kopf.structs.bodies import Body
 from kubernetes.client.rest import ApiException
 
 from mysqloperator.controller.api_utils import ApiSpecError
-from .. import consts, kubeutils, config, utils, errors, diagnose
+from .. import consts, kubeutils, config, utils, errors, diagnose, informer
 from .. import shellutils
-from ..group_monitor import g_group_monitor
+from ..group_monitor import g_group_monitor, k_debounce_window_annotation
+from ..requeue import g_requeue
 from ..utils import g_ephemeral_pod_state
-from ..kubeutils import api_core, api_apps, api_policy, api_rbac, api_cron_job
+from ..kubeutils import api_core, api_apps, api_policy, api_rbac, api_cron_job, catch_404
 from ..backup import backup_objects
 from ..config import DEFAULT_OPERATOR_VERSION_TAG
-from .cluster_controller import ClusterController, ClusterMutex
+from .cluster_controller import ClusterController, WorkPriority, g_cluster_queue, run_exclusive
 from . import cluster_objects, router_objects, cluster_api
-from .cluster_api import InnoDBCluster, InnoDBClusterSpec, MySQLPod, get_all_clusters
+from .cluster_api import InnoDBCluster, InnoDBClusterSpec, MySQLPod
 import kopf
 from logging import Logger
-import time
+import logging
 
 
 # TODO check whether we should store versions in status to make upgrade easier
@@ -39,12 +40,24 @@ def on_group_view_change(cluster: InnoDBCluster, members: list, view_id_changed:
     c.on_group_view_change(members, view_id_changed)
 
 
+def on_group_role_change(cluster: InnoDBCluster, members: list) -> None:
+    """
+    Triggered from the GroupMonitor whenever a member changes role or state,
+    e.g. a new PRIMARY is elected. Updates the cluster-role label of pods
+    ahead of the full membership update.
+    """
+
+    c = ClusterController(cluster)
+    c.on_group_role_change(members)
+
+
 def monitor_existing_clusters(logger: Logger) -> None:
     clusters = cluster_api.get_all_clusters()
     for cluster in clusters:
         if cluster.get_create_time():
             g_group_monitor.monitor_cluster(
-                cluster, on_group_view_change, logger)
+                cluster, on_group_view_change, logger,
+                role_handler=on_group_role_change)
 
 
 @kopf.on.create(consts.GROUP, consts.VERSION,
@@ -186,6 +199,8 @@ def on_innodbcluster_create(name: str, namespace: Optional[str], body: Body,
                 "lastProbeTime": utils.isotime()
             }})
 
+    check_tls_secrets(cluster, logger)
+
 
 @kopf.on.delete(consts.GROUP, consts.VERSION,
                 consts.INNODBCLUSTER_PLURAL)  # type: ignore
@@ -196,6 +211,7 @@ def on_innodbcluster_delete(name: str, namespace: str, body: Body,
     logger.info(f"Deleting cluster {name}")
 
     g_group_monitor.remove_cluster(cluster)
+    g_cluster_queue.discard(cluster)
 
     # Scale down routers to 0
     logger.info(f"Updating Router Deployment.replicas to 0")
@@ -208,6 +224,8 @@ def on_innodbcluster_delete(name: str, namespace: str, body: Body,
         cluster_objects.update_stateful_set_spec(
             sts, {"spec": {"replicas": 0}})
 
+    cluster.forget_status_state()
+
 
 # TODO add a busy state and prevent changes while on it
 
@@ -356,12 +374,14 @@ def on_innodbcluster_field_router_instances(old: int, new: int, body: Body,
             f"Ignoring spec.router.instances change for unready cluster")
         return
 
-    with ClusterMutex(cluster):
+    def update_router_instances():
         logger.info(f"Updating Router Deployment.replicas from {old} to {new}")
         cluster.parsed_spec.validate(logger)
 
         router_objects.update_size(cluster, new, logger)
 
+    run_exclusive(cluster, "router-instances", update_router_instances)
+
 
 @kopf.on.field(consts.GROUP, consts.VERSION, consts.INNODBCLUSTER_PLURAL,
                field="spec.router.version")  # type: ignore
@@ -379,11 +399,13 @@ def on_innodbcluster_field_router_version(old: str, new: str, body: Body,
         return
 
     cluster.parsed_spec.validate(logger)
-    with ClusterMutex(cluster):
+    def update_router_version():
         router_deploy = cluster.get_router_deployment()
         if router_deploy:
             router_objects.update_router_image(router_deploy, cluster.parsed_spec, logger)
 
+    run_exclusive(cluster, "router-version", update_router_version)
+
 
 
 @kopf.on.field(consts.GROUP, consts.VERSION, consts.INNODBCLUSTER_PLURAL,
@@ -413,8 +435,8 @@ def on_innodbcluster_field_backup_schedules(old: str, new: str, body: Body,
         raise kopf.TemporaryError("The cluster is not ready. Will create the schedules once the first instance is up and running", delay=10)
 
     cluster.parsed_spec.validate(logger)
-    with ClusterMutex(cluster):
-        backup_objects.update_schedules(cluster.parsed_spec, old, new, logger)
+    run_exclusive(cluster, "backup-schedules",
+                  lambda: backup_objects.update_schedules(cluster.parsed_spec, old, new, logger))
 
 
 def update_tls_field(body: Body, field: str, logger: Logger) -> None:
@@ -429,6 +451,8 @@ def update_tls_field(body: Body, field: str, logger: Logger) -> None:
 
     cluster_objects.reconcile_stateful_set(cluster, logger)
 
+    check_tls_secrets(cluster, logger)
+
 
 @kopf.on.field(consts.GROUP, consts.VERSION, consts.INNODBCLUSTER_PLURAL,
                field="spec.tlsUseSelfSigned")  # type: ignore
@@ -462,6 +486,20 @@ def on_innodbcluster_field_tls_ca_secret_name(body: Body,
     update_tls_field(body, "spec.tlsCASecretName", logger)
 
 
+@kopf.on.field(consts.GROUP, consts.VERSION, consts.INNODBCLUSTER_PLURAL,
+               field=("metadata", "annotations", k_debounce_window_annotation))  # type: ignore
+def on_innodbcluster_field_debounce_window(body: Body, logger: Logger, **kwargs):
+    logger.info("on_innodbcluster_field_debounce_window")
+    g_group_monitor.update_cluster(InnoDBCluster(body))
+
+
+def cache_pod(pod: MySQLPod) -> None:
+    # pods being deleted are left to the watch of the informer, so that they
+    # aren't stored back after it removed them
+    if not pod.deleting:
+        informer.g_pods.update(pod.pod)
+
+
 @kopf.on.create("", "v1", "pods",
                 labels={"component": "mysqld"})  # type: ignore
 def on_pod_create(body: Body, logger: Logger, **kwargs):
@@ -473,6 +511,8 @@ def on_pod_create(body: Body, logger: Logger, **kwargs):
 
     # TODO ensure that the pod is owned by us
     pod = MySQLPod.from_json(body)
+    # the informer may not have seen this version of the pod yet
+    cache_pod(pod)
 
     # check general assumption
     assert not pod.deleting
@@ -493,13 +533,14 @@ def on_pod_create(body: Body, logger: Logger, **kwargs):
 
     assert cluster
 
-    with ClusterMutex(cluster, pod):
+    def pod_created():
         first_pod = pod.index == 0 and not cluster.get_create_time()
         if first_pod:
             cluster_objects.on_first_cluster_pod_created(cluster, logger)
 
             g_group_monitor.monitor_cluster(
-                cluster, on_group_view_change, logger)
+                cluster, on_group_view_change, logger,
+                role_handler=on_group_role_change)
 
         cluster_ctl = ClusterController(cluster)
 
@@ -509,6 +550,8 @@ def on_pod_create(body: Body, logger: Logger, **kwargs):
         g_ephemeral_pod_state.set(
             pod, "mysql-restarts", pod.get_container_restarts("mysql"))
 
+    run_exclusive(cluster, f"pod-create/{pod.name}", pod_created)
+
 
 @kopf.on.event("", "v1", "pods",
                labels={"component": "mysqld"})  # type: ignore
@@ -518,59 +561,88 @@ def on_pod_event(event, body: Body, logger: Logger, **kwargs):
     - when a container restarts in a Pod (e.g. because of mysqld crash)
     """
     # TODO ensure that the pod is owned by us
+    pod = MySQLPod.from_json(body)
+    if event["type"] != "DELETED":
+        cache_pod(pod)
 
-    while True:
-        try:
-            pod = MySQLPod.from_json(body)
+    handle_pod_event(pod, logger)
 
-            member_info = pod.get_membership_info()
-            ready = pod.check_containers_ready()
-            if pod.phase != "Running" or pod.deleting or not member_info:
-                logger.debug(
-                    f"ignored pod event: pod={pod.name} containers_ready={ready} deleting={pod.deleting} phase={pod.phase} member_info={member_info}")
+
+def handle_pod_event(pod: MySQLPod, logger: Logger) -> None:
+    key = f"pod-event/{pod.namespace}/{pod.name}"
+    try:
+        reconcile_pod(pod, logger)
+        g_requeue.cancel(key)
+    except kopf.TemporaryError as e:
+        # kopf doesn't call event handlers again when they fail, so the retry
+        # is scheduled here, without holding the handler thread meanwhile
+        logger.info(f"{e}: retrying after {e.delay} seconds")
+        namespace, name = pod.namespace, pod.name
+        g_requeue.schedule(key, e.delay or 0,
+                           lambda: retry_pod_event(namespace, name, logger),
+                           kind="pod-event")
+
+
+def retry_pod_event(namespace: str, name: str, logger: Logger) -> None:
+    # retry with the current state of the pod
+    obj = informer.g_pods.get(namespace, name)
+    if obj is not None:
+        pod = MySQLPod(obj)
+    else:
+        try:
+            pod = MySQLPod.read(name, namespace)
+        except ApiException as e:
+            if e.status == 404:
                 return
+            raise
+    handle_pod_event(pod, logger)
 
-            mysql_restarts = pod.get_container_restarts("mysql")
 
-            event = ""
-            if g_ephemeral_pod_state.get(pod, "mysql-restarts") != mysql_restarts:
-                event = "mysql-restarted"
+def reconcile_pod(pod: MySQLPod, logger: Logger) -> None:
+    member_info = pod.get_membership_info()
+    ready = pod.check_containers_ready()
+    if pod.phase != "Running" or pod.deleting or not member_info:
+        logger.debug(
+            f"ignored pod event: pod={pod.name} containers_ready={ready} deleting={pod.deleting} phase={pod.phase} member_info={member_info}")
+        return
 
-            containers = [
-                f"{c.name}={'ready' if c.ready else 'not-ready'}" for c in pod.status.container_statuses]
-            conditions = [
-                f"{c.type}={c.status}" for c in pod.status.conditions]
-            logger.debug(f"POD EVENT {event}: pod={pod.name} containers_ready={ready} deleting={pod.deleting} phase={pod.phase} member_info={member_info} restarts={mysql_restarts} containers={containers} conditions={conditions}")
+    mysql_restarts = pod.get_container_restarts("mysql")
 
-            cluster = pod.get_cluster()
-            if not cluster:
-                logger.info(
-                    f"Ignoring event for pod {pod.name} belonging to a deleted cluster")
-                return
-            with ClusterMutex(cluster, pod):
-                cluster_ctl = ClusterController(cluster)
-
-                # Check if a container in the pod restarted
-                if ready and event == "mysql-restarted":
-                    cluster_ctl.on_pod_restarted(pod, logger)
-
-                    g_ephemeral_pod_state.set(
-                        pod, "mysql-restarts", mysql_restarts)
-
-                # Check if we should refresh the cluster status
-                status = cluster_ctl.probe_status_if_needed(pod, logger)
-                if status == diagnose.ClusterDiagStatus.UNKNOWN:
-                    raise kopf.TemporaryError(
-                        f"Cluster has unreachable members. status={status}", delay=15)
-                break
-        except kopf.TemporaryError as e:
-            # TODO review this
-            # Manually handle retries, the event handler isn't getting called again
-            # by kopf (maybe a bug or maybe we're using it wrong)
-            logger.info(f"{e}: retrying after {e.delay} seconds")
-            if e.delay:
-                time.sleep(e.delay)
-            continue
+    event = ""
+    if g_ephemeral_pod_state.get(pod, "mysql-restarts") != mysql_restarts:
+        event = "mysql-restarted"
+
+    if logger.isEnabledFor(logging.DEBUG):
+        containers = [
+            f"{c['name']}={'ready' if c.get('ready') else 'not-ready'}" for c in pod.status.get("containerStatuses") or []]
+        conditions = [
+            f"{c['type']}={c['status']}" for c in pod.status.get("conditions") or []]
+        logger.debug(f"POD EVENT {event}: pod={pod.name} containers_ready={ready} deleting={pod.deleting} phase={pod.phase} member_info={member_info} restarts={mysql_restarts} containers={containers} conditions={conditions}")
+
+    cluster = pod.get_cluster()
+    if not cluster:
+        logger.info(
+            f"Ignoring event for pod {pod.name} belonging to a deleted cluster")
+        return
+    restarted = ready and event == "mysql-restarted"
+    priority = WorkPriority.FAILURE if restarted else WorkPriority.INFO
+    def pod_changed():
+        cluster_ctl = ClusterController(cluster)
+
+        # Check if a container in the pod restarted
+        if restarted:
+            cluster_ctl.on_pod_restarted(pod, logger)
+
+            g_ephemeral_pod_state.set(
+                pod, "mysql-restarts", mysql_restarts)
+
+        # Check if we should refresh the cluster status
+        status = cluster_ctl.probe_status_if_needed(pod, logger)
+        if status == diagnose.ClusterDiagStatus.UNKNOWN:
+            raise kopf.TemporaryError(
+                f"Cluster has unreachable members. status={status}", delay=15)
+
+    run_exclusive(cluster, f"pod-event/{pod.name}", pod_changed, priority)
 
 
 @kopf.on.delete("", "v1", "pods",
@@ -592,21 +664,34 @@ def on_pod_delete(body: Body, logger: Logger, **kwargs):
     cluster = pod.get_cluster()
 
     if cluster:
-        with ClusterMutex(cluster, pod):
+        # queued work for the pod is moot now
+        g_cluster_queue.discard(cluster, f"pod-create/{pod.name}")
+        g_cluster_queue.discard(cluster, f"pod-event/{pod.name}")
+
+        def pod_deleted():
             cluster_ctl = ClusterController(cluster)
 
             cluster_ctl.on_pod_deleted(pod, body, logger)
 
             if pod.index == 0 and cluster.deleting:
                 cluster_objects.on_last_cluster_pod_removed(cluster, logger)
+
+        run_exclusive(cluster, f"pod-delete/{pod.name}", pod_deleted,
+                      WorkPriority.DELETE)
     else:
         pod.remove_member_finalizer(body)
 
         logger.error(f"Owner cluster for {pod.name} does not exist anymore")
 
 
-@kopf.on.create("", "v1", "secrets") # type: ignore
-@kopf.on.update("", "v1", "secrets") # type: ignore
+def is_cluster_tls_secret(name: str, namespace: str, **_) -> bool:
+    items = informer.g_clusters.list_indexed("tls-secret", namespace, name)
+    # without the informer every secret has to be checked
+    return items is None or bool(items)
+
+
+@kopf.on.create("", "v1", "secrets", when=is_cluster_tls_secret) # type: ignore
+@kopf.on.update("", "v1", "secrets", when=is_cluster_tls_secret) # type: ignore
 def on_secret_create(name: str, namespace: str, logger: Logger, **kwargs):
     """
     Wait for Secret objects used by clusters for TLS CA and certificate.
@@ -624,15 +709,34 @@ def on_secret_create(name: str, namespace: str, logger: Logger, **kwargs):
     become active.
     """
     logger.info("operator: on_secret_create")
-    clusters = get_all_clusters(namespace)
+    clusters = cluster_api.get_clusters_using_tls_secret(namespace, name)
 
     # check for any clusters that reference this secret
     for cluster in clusters:
-        if cluster.parsed_spec.tlsCASecretName == name:
-            logger.info("operator: TLS CA was changed")
-            ic = ClusterController(cluster)
-            ic.on_router_tls_changed()
-        elif cluster.parsed_spec.router.tlsSecretName == name:
-            logger.info("operator: TLS KEY/CERT was changed")
-            ic = ClusterController(cluster)
-            ic.on_router_tls_changed()
+        on_tls_secret_changed(cluster, name, logger)
+
+
+def on_tls_secret_changed(cluster: InnoDBCluster, name: str, logger: Logger) -> None:
+    if cluster.parsed_spec.tlsCASecretName == name:
+        logger.info("operator: TLS CA was changed")
+        ic = ClusterController(cluster)
+        ic.on_router_tls_changed()
+    elif cluster.parsed_spec.router.tlsSecretName == name:
+        logger.info("operator: TLS KEY/CERT was changed")
+        ic = ClusterController(cluster)
+        ic.on_router_tls_changed()
+
+
+def check_tls_secrets(cluster: InnoDBCluster, logger: Logger) -> None:
+    """
+    Handle the TLS Secrets a cluster references that already exist. Their
+    events are filtered out by is_cluster_tls_secret() if they arrive before
+    the informer has seen the cluster (or its new spec), and kopf doesn't
+    deliver them again.
+    """
+    if cluster.parsed_spec.tlsUseSelfSigned:
+        return
+    for name in (cluster.parsed_spec.tlsCASecretName,
+                 cluster.parsed_spec.router.tlsSecretName):
+        if catch_404(lambda: api_core.read_namespaced_secret(name, cluster.namespace)):
+            on_tls_secret_changed(cluster, name, logger)
@@ -69,6 +69,9 @@ apiVersion: v1
 kind: Secret
 metadata:
   name: {spec.name}-router
+  labels:
+    tier: mysql
+    mysql.oracle.com/cluster: {spec.name}
 data:
   routerUsername: {router_user}
   routerPassword: {router_pwd}
@@ -102,7 +105,7 @@ apiVersion: apps/v1
 kind: Deployment
 metadata:
   name: {spec.name}-router
-  label:
+  labels:
     tier: mysql
     mysql.oracle.com/cluster: {spec.name}
     app.kubernetes.io/name: mysql-innodbcluster
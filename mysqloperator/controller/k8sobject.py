@@ -2,14 +2,220 @@
 #
 # Licensed under the Universal Permissive License v 1.0 as shown at https://oss.oracle.com/licenses/upl/
 
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
+from kubernetes.client.rest import ApiException
 
+import atexit
 import datetime
-from .kubeutils import api_core
+import logging
+import os
+import queue
+import threading
+import time
+from .kubeutils import api_core, TokenBucket
+from .metrics import g_metrics
 
 g_component = None
 g_host = None
 
+# Identical events posted within this many seconds of each other are
+# recorded by incrementing the count of the existing Event object
+k_event_aggregate_window = int(
+    os.getenv("MYSQL_OPERATOR_EVENT_AGGREGATE_WINDOW", default="600"))
+
+# Once an object got this many events with the same reason but different
+# messages within the window, further ones are combined into a single Event
+k_event_similar_max = 10
+
+# Per object rate limit: bursts of k_event_burst events, then one every
+# k_event_refill seconds (same as client-go's spam filter)
+k_event_burst = 25
+k_event_refill = 300
+
+# Events waiting to be written. When full, new events are dropped.
+k_event_queue_size = 1000
+
+# How long to wait for queued events to be written at exit (seconds)
+k_event_flush_timeout = 5
+
+_events_posted = g_metrics.counter(
+    "mysql_operator_events_posted_total",
+    "k8s Events created or updated")
+_events_aggregated = g_metrics.counter(
+    "mysql_operator_events_aggregated_total",
+    "k8s Events recorded by incrementing the count of an existing Event")
+_events_dropped = g_metrics.counter(
+    "mysql_operator_events_dropped_total",
+    "k8s Events not written because of rate limits or errors")
+
+# namespace, involvedObject uid (or kind/name), type, reason, action, message
+EventKey = Tuple[str, str, str, str, str, str]
+
+
+class _RecordedEvent:
+    __slots__ = ("name", "count", "last_seen")
+
+    def __init__(self, name: str, count: int):
+        self.name = name
+        self.count = count
+        self.last_seen = time.monotonic()
+
+
+class EventRecorder(threading.Thread):
+    """
+    Writes k8s Events in the background, so that posting an event never
+    blocks the caller.
+
+    Repeats of an event are folded into the Event object already created
+    for it by patching its count and lastTimestamp, events with the same
+    reason and many different messages are combined and events of each
+    object are rate limited, like the event correlator of client-go does.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name="event-recorder")
+        self.queue: queue.Queue = queue.Queue(maxsize=k_event_queue_size)
+        self.lock = threading.Lock()
+
+        # Only accessed from the recorder thread
+        self.recorded: Dict[EventKey, _RecordedEvent] = {}
+        self.similar: Dict[EventKey, Dict[str, float]] = {}
+        self.limiters: Dict[str, TokenBucket] = {}
+        self.last_prune = time.monotonic()
+
+    def post(self, namespace: str, body: dict) -> None:
+        with self.lock:
+            if not self.is_alive():
+                self.start()
+        try:
+            self.queue.put_nowait((namespace, body))
+        except queue.Full:
+            _events_dropped.inc(reason="queue_full")
+
+    def flush(self, timeout: float = k_event_flush_timeout) -> None:
+        """Wait until queued events are written"""
+        deadline = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while True:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self._record_batch(batch)
+            except Exception as e:
+                print(f"EventRecorder: error writing events: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _record_batch(self, batch: List[Tuple[str, dict]]) -> None:
+        # identical events in the same batch are written once
+        pending: Dict[EventKey, Tuple[str, dict, int]] = {}
+        for namespace, body in batch:
+            body = self._combine_similar(namespace, body)
+            key = _event_key(namespace, body,
+                             with_message=not body.get("_combined"))
+            if key in pending:
+                pending[key] = (namespace, body, pending[key][2] + 1)
+                _events_aggregated.inc(type=body["type"])
+            else:
+                pending[key] = (namespace, body, 1)
+
+        for key, (namespace, body, count) in pending.items():
+            self._record(key, namespace, body, count)
+
+        now = time.monotonic()
+        if now - self.last_prune > k_event_aggregate_window:
+            self._prune(now)
+
+    def _combine_similar(self, namespace: str, body: dict) -> dict:
+        similar_key = _event_key(namespace, body, with_message=False)
+        messages = self.similar.setdefault(similar_key, {})
+        messages[body["message"]] = time.monotonic()
+        if len(messages) <= k_event_similar_max:
+            return body
+        body = dict(body)
+        body["message"] = "(combined from similar events): " + body["message"]
+        body["_combined"] = True
+        return body
+
+    def _record(self, key: EventKey, namespace: str, body: dict,
+                count: int) -> None:
+        object_key = key[1]
+        limiter = self.limiters.get(object_key)
+        if not limiter:
+            limiter = self.limiters[object_key] = TokenBucket(
+                1 / k_event_refill, k_event_burst)
+        if not limiter.try_acquire():
+            _events_dropped.inc(reason="rate_limit")
+            return
+
+        now = datetime.datetime.utcnow().isoformat() + "Z"
+        recorded = self.recorded.get(key)
+        if recorded and time.monotonic() - recorded.last_seen < k_event_aggregate_window:
+            patch = {"count": recorded.count + count, "lastTimestamp": now}
+            if body.get("_combined"):
+                patch["message"] = body["message"]
+            try:
+                api_core.patch_namespaced_event(recorded.name, namespace, patch)
+                recorded.count += count
+                recorded.last_seen = time.monotonic()
+                _events_posted.inc(type=body["type"])
+                _events_aggregated.inc(type=body["type"])
+                return
+            except ApiException as e:
+                # the Event may have expired
+                if e.status != 404:
+                    _events_dropped.inc(reason="error")
+                    print(f"EventRecorder: error updating event {recorded.name}: {e}")
+                    return
+
+        body = {k: v for k, v in body.items() if k != "_combined"}
+        body["count"] = count
+        body["firstTimestamp"] = now
+        body["lastTimestamp"] = now
+        try:
+            event = api_core.create_namespaced_event(namespace, body)
+        except ApiException as e:
+            _events_dropped.inc(reason="error")
+            print(f"EventRecorder: error creating event {body['reason']}: {e}")
+            return
+        self.recorded[key] = _RecordedEvent(event.metadata.name, count)
+        _events_posted.inc(type=body["type"])
+
+    def _prune(self, now: float) -> None:
+        expired = now - k_event_aggregate_window
+        self.recorded = {k: r for k, r in self.recorded.items()
+                         if r.last_seen > expired}
+        for key in list(self.similar):
+            messages = {m: t for m, t in self.similar[key].items() if t > expired}
+            if messages:
+                self.similar[key] = messages
+            else:
+                del self.similar[key]
+        # idle buckets are full again and can be recreated when needed
+        self.limiters = {k: b for k, b in self.limiters.items()
+                         if b.last > now - k_event_burst * k_event_refill}
+        self.last_prune = now
+
+
+def _event_key(namespace: str, body: dict, with_message: bool = True) -> EventKey:
+    ref = body["involvedObject"]
+    object_key = ref.get("uid") or f"{ref.get('kind')}/{ref.get('name')}"
+    return (namespace, object_key, body["type"], body["reason"],
+            body.get("action") or "", body["message"] if with_message else "")
+
+
+g_event_recorder = EventRecorder()
+atexit.register(g_event_recorder.flush)
+
 
 def post_event(namespace: str, object_ref: dict, type: str, action: str,
                reason: str, message: str) -> None:
@@ -44,7 +250,29 @@ def post_event(namespace: str, object_ref: dict, type: str, action: str,
 
         'type': type
     }
-    api_core.create_namespaced_event(namespace, body)
+    g_event_recorder.post(namespace, body)
+
+
+class EventLogHandler(logging.Handler):
+    """
+    Posts the messages kopf logs for an object as Events through the event
+    recorder, instead of kopf's own poster which writes each of them.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return (hasattr(record, "k8s_ref") and
+                not getattr(record, "k8s_skip", False) and
+                super().filter(record))
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            ref = record.k8s_ref
+            post_event(ref.get("namespace"), ref,
+                       type="Warning" if record.levelno >= logging.WARNING else "Normal",
+                       action="Logging", reason="Logging",
+                       message=self.format(record))
+        except Exception:
+            self.handleError(record)
 
 
 class K8sInterfaceObject:
@@ -52,6 +280,8 @@ class K8sInterfaceObject:
     Base class for objects meant to interface with Kubernetes.
     """
 
+    __slots__ = ()
+
     def __init__(self) -> None:
         pass
 
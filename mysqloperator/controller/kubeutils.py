@@ -3,9 +3,13 @@
 # Licensed under the Universal Permissive License v 1.0 as shown at https://oss.oracle.com/licenses/upl/
 #
 
-from typing import Callable, Optional, TypeVar
+from typing import Callable, Optional, Tuple, TypeVar
 from kubernetes.client.rest import ApiException
 from kubernetes import client, config
+from .metrics import g_metrics
+import threading
+import time
+import os
 
 try:
     # outside k8s
@@ -18,13 +22,139 @@ except config.config_exception.ConfigException:
         raise Exception(
             "Could not configure kubernetes python client")
 
-api_core: client.CoreV1Api = client.CoreV1Api()
-api_customobj: client.CustomObjectsApi = client.CustomObjectsApi()
-api_apps: client.AppsV1Api = client.AppsV1Api()
-api_batch: client.BatchV1Api = client.BatchV1Api()
-api_cron_job: client.BatchV1beta1Api = client.BatchV1beta1Api()
-api_policy: client.PolicyV1beta1Api = client.PolicyV1beta1Api()
-api_rbac: client.RbacAuthorizationV1Api = client.RbacAuthorizationV1Api()
+# Max number of connections kept open to the API server
+k_pool_size = int(os.getenv("MYSQL_OPERATOR_K8S_POOL_SIZE", default="16"))
+
+# Client side rate limit of API requests: sustained requests per second and
+# burst size. A QPS of 0 disables the limit.
+k_qps = float(os.getenv("MYSQL_OPERATOR_K8S_QPS", default="20"))
+k_burst = int(os.getenv("MYSQL_OPERATOR_K8S_BURST", default="40"))
+
+_request_time = g_metrics.histogram(
+    "mysql_operator_k8s_request_seconds",
+    "Latency of k8s API requests")
+_request_errors = g_metrics.counter(
+    "mysql_operator_k8s_request_errors_total",
+    "k8s API requests that failed")
+_rate_limit_wait = g_metrics.histogram(
+    "mysql_operator_k8s_rate_limit_wait_seconds",
+    "Time k8s API requests waited for the client side rate limiter")
+
+
+class TokenBucket:
+    """
+    Allows qps requests per second on average, with bursts of up to burst
+    requests.
+    """
+
+    def __init__(self, qps: float, burst: int):
+        self.qps = qps
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.qps)
+        self.last = now
+
+    def reserve(self) -> float:
+        """Take a token, returning how long to wait until it can be used"""
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.qps
+
+    def try_acquire(self) -> bool:
+        """Take a token if one is available right now"""
+        with self.lock:
+            self._refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def acquire(self) -> float:
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+def request_kind(method: str, url: str, query_params) -> Tuple[str, str]:
+    """
+    Return the verb (get, list, watch, create...) and resource (e.g. pods or
+    pods/status) of a request
+    """
+    path = url.split("://", 1)[-1].split("?", 1)[0].split("/")[1:]
+    # /api/v1/... or /apis/<group>/<version>/...
+    if path and path[0] == "api":
+        rest = path[2:]
+    else:
+        rest = path[3:]
+    if len(rest) >= 3 and rest[0] == "namespaces":
+        rest = rest[2:]
+    resource = rest[0] if rest else "namespaces"
+    if len(rest) >= 3:
+        resource += "/" + rest[2]
+
+    named = len(rest) >= 2
+    if method == "GET":
+        if any(k == "watch" and v for k, v in query_params or []):
+            verb = "watch"
+        else:
+            verb = "get" if named else "list"
+    else:
+        verb = {"POST": "create", "PUT": "update", "PATCH": "patch",
+                "DELETE": "delete"}.get(method, method.lower())
+    return verb, resource
+
+
+class RateLimitedApiClient(client.ApiClient):
+    """
+    ApiClient shared by all API objects of the operator, sidecar and backup
+    jobs. Requests are rate limited and their latency and errors recorded.
+    """
+
+    def __init__(self, configuration: client.Configuration):
+        super().__init__(configuration)
+        self.rate_limiter = TokenBucket(k_qps, k_burst) if k_qps > 0 else None
+
+    def request(self, method, url, query_params=None, *args, **kwargs):
+        verb, resource = request_kind(method, url, query_params)
+        if self.rate_limiter:
+            waited = self.rate_limiter.acquire()
+            if waited:
+                _rate_limit_wait.observe(waited, verb=verb, resource=resource)
+
+        start = time.monotonic()
+        try:
+            return super().request(method, url, query_params, *args, **kwargs)
+        except ApiException as e:
+            _request_errors.inc(verb=verb, resource=resource, code=e.status)
+            raise
+        except Exception:
+            _request_errors.inc(verb=verb, resource=resource, code="")
+            raise
+        finally:
+            _request_time.observe(time.monotonic() - start,
+                                  verb=verb, resource=resource)
+
+
+_configuration = client.Configuration.get_default_copy()
+_configuration.connection_pool_maxsize = k_pool_size
+api_client = RateLimitedApiClient(_configuration)
+
+api_core: client.CoreV1Api = client.CoreV1Api(api_client)
+api_customobj: client.CustomObjectsApi = client.CustomObjectsApi(api_client)
+api_apps: client.AppsV1Api = client.AppsV1Api(api_client)
+api_batch: client.BatchV1Api = client.BatchV1Api(api_client)
+api_cron_job: client.BatchV1beta1Api = client.BatchV1beta1Api(api_client)
+api_policy: client.PolicyV1beta1Api = client.PolicyV1beta1Api(api_client)
+api_rbac: client.RbacAuthorizationV1Api = client.RbacAuthorizationV1Api(api_client)
 
 T = TypeVar("T")
 
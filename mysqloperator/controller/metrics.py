@@ -0,0 +1,197 @@
+# Copyright (c) 2020, 2021, Oracle and/or its affiliates.
+#
+# Licensed under the Universal Permissive License v 1.0 as shown at https://oss.oracle.com/licenses/upl/
+#
+
+# In-process operator metrics.
+#
+# Metrics are kept in memory and can be read as a dict (reported by the kopf
+# liveness probe) or in Prometheus text format, served over HTTP when
+# MYSQL_OPERATOR_METRICS_PORT is set.
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+import bisect
+import threading
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5,
+                   5, 10, 30, 60)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values: Dict[LabelKey, object] = {}
+
+    def remove(self, **labels) -> None:
+        with self.lock:
+            self.values.pop(_label_key(labels), None)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {_format_labels(k) or "total": self._value_snapshot(v)
+                    for k, v in self.values.items()}
+
+    def _value_snapshot(self, value):
+        return value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.type}"]
+        with self.lock:
+            for key, value in self.values.items():
+                lines += self._render_value(key, value)
+        return lines
+
+    def _render_value(self, key: LabelKey, value) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {value}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, value: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def get(self, **labels) -> float:
+        with self.lock:
+            return self.values.get(_label_key(labels), 0)
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self.lock:
+            self.values[_label_key(labels)] = value
+
+    def dec(self, value: float = 1, **labels) -> None:
+        self.inc(-value, **labels)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str,
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        with self.lock:
+            h = self.values.get(key)
+            if h is None:
+                h = self.values[key] = _HistogramValue(self.buckets)
+            h.counts[bisect.bisect_left(self.buckets, value)] += 1
+            h.sum += value
+            h.count += 1
+
+    def _value_snapshot(self, h: _HistogramValue) -> dict:
+        return {"count": h.count, "sum": round(h.sum, 6),
+                "avg": round(h.sum / h.count, 6) if h.count else 0}
+
+    def _render_value(self, key: LabelKey, h: _HistogramValue) -> List[str]:
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), h.counts):
+            total += count
+            le = "+Inf" if bound == float("inf") else str(bound)
+            lines.append(
+                f"{self.name}_bucket{_format_labels(key, ('le', le))} {total}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {h.sum}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {h.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics: Dict[str, Metric] = {}
+
+    def _get(self, cls, name: str, *args) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args)
+            assert isinstance(metric, cls), f"{name} is not a {cls.__name__}"
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str,
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        return {m.name: m.snapshot() for m in metrics}
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for m in metrics:
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+g_metrics = Registry()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        data = g_metrics.render().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_http_server(port: int) -> ThreadingHTTPServer:
+    """
+    Serve metrics in Prometheus text format at http://:port/metrics
+    """
+    server = ThreadingHTTPServer(("", port), _MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True,
+                              name="metrics-http")
+    thread.start()
+    return server
@@ -3,6 +3,7 @@
 # Licensed under the Universal Permissive License v 1.0 as shown at https://oss.oracle.com/licenses/upl/
 #
 
+from .gtid import GtidSet
 import mysqlsh
 
 
@@ -100,16 +101,6 @@ def setup_backup_account(session, user, password):
 
 def count_gtids(gtid_set: str) -> int:
     """Return number of transactions in the GTID set"""
-    def count_range(r):
-        begin, _, end = r.partition("-")
-        if not end:
-            return 1
-        else:
-            return int(end)-int(begin)+1
-    n = 0
-    for g in gtid_set.replace("\n", "").split(","):
-        for r in g.split(":")[1:]:
-            n += count_range(r)
-    return n
+    return GtidSet.parse(gtid_set).count()
 
 
@@ -6,10 +6,14 @@
 from logging import Logger
 from .innodbcluster import operator_cluster
 from .backup import operator_backup
-from . import config, utils
+from . import config, utils, informer, k8sobject
 from .group_monitor import g_group_monitor
+from .requeue import g_requeue
+from .metrics import g_metrics
+from . import metrics
 import kopf
 import logging
+import os
 
 
 # @kopf.on.login()
@@ -22,8 +26,12 @@ def on_startup(settings: kopf.OperatorSettings, logger: Logger, *args, **_):
     utils.log_banner(__file__, logger)
     config.log_config_banner(logger)
 
-    # don't post logger.debug() calls as k8s events
-    settings.posting.level = logging.INFO
+    # don't post logger.debug() calls as k8s events, and post the others
+    # through our event recorder, which aggregates repeated messages
+    settings.posting.enabled = False
+    event_log_handler = k8sobject.EventLogHandler(level=logging.INFO)
+    event_log_handler.setFormatter(logging.Formatter("%(message)s"))
+    logging.getLogger("kopf.objects").addHandler(event_log_handler)
 
     # Change the annotation field for storing kopf state, so that the main operator
     # and the pod controller don't collide
@@ -33,11 +41,26 @@ def on_startup(settings: kopf.OperatorSettings, logger: Logger, *args, **_):
     #     name='operator.mysql.oracle.com/last-handled-configuration'
     # )
 
+    informer.start_informers()
+
     operator_cluster.monitor_existing_clusters(logger)
 
     g_group_monitor.start()
 
+    metrics_port = os.getenv("MYSQL_OPERATOR_METRICS_PORT")
+    if metrics_port:
+        metrics.start_http_server(int(metrics_port))
+        logger.info(f"Serving metrics on port {metrics_port}")
+
+
+@kopf.on.probe(id="metrics")  # type: ignore
+def on_probe_metrics(**kwargs):
+    return g_metrics.snapshot()
+
 
 @kopf.on.cleanup()  # type: ignore
 def on_shutdown(logger: Logger, *args, **kwargs):
     g_group_monitor.stop()
+    g_requeue.stop()
+    informer.stop_informers()
+    k8sobject.g_event_recorder.flush()
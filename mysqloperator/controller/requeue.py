@@ -0,0 +1,125 @@
+# Copyright (c) 2020, 2021, Oracle and/or its affiliates.
+#
+# Licensed under the Universal Permissive License v 1.0 as shown at https://oss.oracle.com/licenses/upl/
+#
+
+# Delayed retries of work that failed with a temporary error, run later
+# from a small thread pool instead of sleeping in the handler that failed.
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+from .metrics import g_metrics
+import heapq
+import itertools
+import os
+import threading
+import time
+
+# Threads running the retries
+k_requeue_workers = int(os.getenv("MYSQL_OPERATOR_REQUEUE_WORKERS", default="4"))
+
+_pending = g_metrics.gauge(
+    "mysql_operator_requeue_pending",
+    "Retries waiting for their time to run")
+_wait_time = g_metrics.histogram(
+    "mysql_operator_requeue_wait_seconds",
+    "Time from scheduling a retry until it started running",
+    buckets=(1, 2.5, 5, 10, 15, 20, 30, 60, 120, 300))
+
+
+class _Entry:
+    __slots__ = ("due", "func", "scheduled_at", "kind")
+
+    def __init__(self, due: float, func: Callable[[], None], kind: str):
+        self.due = due
+        self.func = func
+        self.scheduled_at = time.monotonic()
+        self.kind = kind
+
+
+class RequeueScheduler(threading.Thread):
+    """
+    Runs functions after a delay. Each function is scheduled under a key
+    (e.g. a pod), with at most one retry pending per key: scheduling again
+    keeps the earliest time and the latest function.
+    """
+
+    def __init__(self):
+        super().__init__(daemon=True, name="requeue-scheduler")
+        self.cond = threading.Condition()
+        self.heap: List[Tuple[float, int, str]] = []
+        self.entries: Dict[str, _Entry] = {}
+        self.seq = itertools.count()
+        self.executor = ThreadPoolExecutor(max_workers=k_requeue_workers,
+                                           thread_name_prefix="requeue")
+        self.stopped = False
+
+    def schedule(self, key: str, delay: float, func: Callable[[], None],
+                 kind: str = "") -> None:
+        due = time.monotonic() + delay
+        with self.cond:
+            if not self.is_alive() and not self.stopped:
+                self.start()
+
+            entry = self.entries.get(key)
+            if entry and entry.due <= due:
+                entry.func = func
+                return
+            if entry:
+                entry.due = due
+                entry.func = func
+            else:
+                self.entries[key] = _Entry(due, func, kind)
+            heapq.heappush(self.heap, (due, next(self.seq), key))
+            _pending.set(len(self.entries))
+            self.cond.notify()
+
+    def cancel(self, key: str) -> None:
+        with self.cond:
+            if self.entries.pop(key, None):
+                _pending.set(len(self.entries))
+
+    def pending(self, key: str) -> bool:
+        with self.cond:
+            return key in self.entries
+
+    def run(self) -> None:
+        while True:
+            with self.cond:
+                while not self.stopped:
+                    now = time.monotonic()
+                    # drop heap items of cancelled or rescheduled entries
+                    while self.heap:
+                        due, _, key = self.heap[0]
+                        entry = self.entries.get(key)
+                        if entry and entry.due == due:
+                            break
+                        heapq.heappop(self.heap)
+                    if self.heap and self.heap[0][0] <= now:
+                        break
+                    self.cond.wait(self.heap[0][0] - now if self.heap else None)
+                if self.stopped:
+                    return
+
+                _, _, key = heapq.heappop(self.heap)
+                entry = self.entries.pop(key)
+                _pending.set(len(self.entries))
+
+            _wait_time.observe(time.monotonic() - entry.scheduled_at,
+                               kind=entry.kind)
+            self.executor.submit(self._run, key, entry.func)
+
+    def _run(self, key: str, func: Callable[[], None]) -> None:
+        try:
+            func()
+        except Exception as e:
+            print(f"RequeueScheduler: retry of {key} failed: {e}")
+
+    def stop(self) -> None:
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        self.executor.shutdown(wait=False)
+
+
+g_requeue = RequeueScheduler()
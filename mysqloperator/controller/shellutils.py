@@ -7,9 +7,15 @@ from logging import Logger
 
 from .innodbcluster.cluster_api import MySQLPod
 import typing
-from typing import Any, Optional, Callable, TYPE_CHECKING, Union
+from typing import Any, Awaitable, Optional, Callable, TYPE_CHECKING, Union
+from .metrics import g_metrics
+import asyncio
+import contextvars
 import mysqlsh
 import kopf
+import os
+import random
+import threading
 import time
 if TYPE_CHECKING:
     from mysqlsh.mysql import ClassicSession
@@ -72,53 +78,304 @@ class GiveUp(Exception):
 T = typing.TypeVar("T")
 
 
+# Deadline (time.monotonic()) of the innermost RetryLoop.call() running in the
+# current thread or task. Nested retry loops don't wait past it.
+_retry_deadline: "contextvars.ContextVar[Optional[float]]" = contextvars.ContextVar(
+    "retry_deadline", default=None)
+
+# Bounds of the delay between attempts (seconds)
+k_retry_base_delay = 1
+k_retry_max_delay = 10
+
+_retry_attempts = g_metrics.counter(
+    "mysql_operator_retry_attempts_total",
+    "Calls made by RetryLoop, including the first one")
+_retry_wait = g_metrics.counter(
+    "mysql_operator_retry_wait_seconds_total",
+    "Time RetryLoop spent waiting between attempts")
+_retry_giveups = g_metrics.counter(
+    "mysql_operator_retry_giveups_total",
+    "RetryLoop calls that failed after retrying")
+
+
+def decorrelated_jitter(delay: float) -> float:
+    """Next delay: random between the base delay and 3x the previous one"""
+    return min(k_retry_max_delay, random.uniform(k_retry_base_delay, delay * 3))
+
+
 class RetryLoop:
+    """
+    Calls a function, retrying MySQL errors until timeout seconds have passed
+    since the first call or max_tries calls were made.
+
+    The deadline also applies to RetryLoops nested in the function, which
+    won't wait past it. Delays between attempts come from backoff, by
+    default with decorrelated jitter.
+    """
+
     def __init__(self, logger: Logger, timeout: int = 60,
                  max_tries: Optional[int] = None,
                  is_retriable: Optional[Callable] = None,
-                 backoff: Callable[[int], int] = lambda i: i+1):
+                 backoff: Callable[[float], float] = decorrelated_jitter):
         self.logger = logger
         self.timeout = timeout
         self.max_tries = max_tries
         self.backoff = backoff
         self.is_retriable = is_retriable
 
+    def _deadline(self) -> float:
+        deadline = time.monotonic() + self.timeout
+        outer = _retry_deadline.get()
+        if outer is not None:
+            deadline = min(deadline, outer)
+        return deadline
+
+    def _handle_error(self, f: Callable, err: Exception, tries: int,
+                      delay: float, deadline: float) -> Optional[float]:
+        """
+        Return how long to wait before retrying after err. Raises the error
+        (or the one wrapped by GiveUp) if it must not be retried, or returns
+        None if the call must return None.
+        """
+        site = f.__qualname__
+        if isinstance(err, GiveUp):
+            self.logger.error(
+                f"Error executing {site}, giving up: {err.real_exc}")
+            _retry_giveups.inc(site=site)
+            if err.real_exc:
+                raise err.real_exc
+            return None
+
+        if self.is_retriable and not self.is_retriable(err):
+            raise err
+
+        remaining = deadline - time.monotonic()
+        if remaining > 0 and (self.max_tries is None or tries < self.max_tries):
+            delay = min(delay, remaining)
+            self.logger.info(
+                f"Error executing {site}, retrying after {delay:.1f}s: {err}")
+            _retry_wait.inc(delay, site=site)
+            return delay
+
+        self.logger.error(f"Error executing {site}, giving up: {err}")
+        _retry_giveups.inc(site=site)
+        raise err
+
     def call(self, f: Callable[..., T], *args, **kwargs) -> T:
-        delay = 1
-        tries = 0
-        total_wait = 0
-        while True:
-            try:
-                tries += 1
-                return f(*args)
-            except (kopf.PermanentError, kopf.TemporaryError) as err:
-                # Don't retry kopf errors
-                raise
-            except GiveUp as err:
-                self.logger.error(
-                    f"Error executing {f.__qualname__}, giving up: {err.real_exc}")
-                if err.real_exc:
-                    raise err.real_exc
-                else:
-                    return None
-            except mysqlsh.Error as err:
-                if self.is_retriable and not self.is_retriable(err):
+        deadline = self._deadline()
+        token = _retry_deadline.set(deadline)
+        try:
+            delay = k_retry_base_delay
+            tries = 0
+            while True:
+                try:
+                    tries += 1
+                    _retry_attempts.inc(site=f.__qualname__)
+                    return f(*args, **kwargs)
+                except (kopf.PermanentError, kopf.TemporaryError):
+                    # Don't retry kopf errors
                     raise
+                except (GiveUp, mysqlsh.Error) as err:
+                    wait = self._handle_error(f, err, tries, delay, deadline)
+                    if wait is None:
+                        return None
+                    time.sleep(wait)
+                    delay = self.backoff(delay)
+        finally:
+            _retry_deadline.reset(token)
 
-                if total_wait < self.timeout and (self.max_tries is None or tries < self.max_tries):
-                    self.logger.info(
-                        f"Error executing {f.__qualname__}, retrying after {delay}s: {err}")
-                    time.sleep(delay)
-                    total_wait += delay
+    async def call_async(self, f: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """Same as call(), for coroutine functions"""
+        deadline = self._deadline()
+        token = _retry_deadline.set(deadline)
+        try:
+            delay = k_retry_base_delay
+            tries = 0
+            while True:
+                try:
+                    tries += 1
+                    _retry_attempts.inc(site=f.__qualname__)
+                    return await f(*args, **kwargs)
+                except (kopf.PermanentError, kopf.TemporaryError):
+                    raise
+                except (GiveUp, mysqlsh.Error) as err:
+                    wait = self._handle_error(f, err, tries, delay, deadline)
+                    if wait is None:
+                        return None
+                    await asyncio.sleep(wait)
                     delay = self.backoff(delay)
+        finally:
+            _retry_deadline.reset(token)
+
+
+# Idle sessions are closed after this many seconds
+k_session_idle_timeout = float(
+    os.getenv("MYSQL_OPERATOR_SESSION_IDLE_TIMEOUT", default="60"))
+
+# Sessions idle for longer than this are checked with a query before reuse
+k_session_validate_after = 5
+
+# Max idle sessions kept per endpoint and account
+k_session_pool_size = 4
+
+_pool_requests = g_metrics.counter(
+    "mysql_operator_session_pool_requests_total",
+    "Sessions requested from the pool, by whether an idle one was reused")
+_pool_idle = g_metrics.gauge(
+    "mysql_operator_session_pool_idle",
+    "Idle sessions in the pool")
+
+# Restores session state a user of a pooled session may have changed
+k_session_reset_sql = [
+    "ROLLBACK",
+    "SET SESSION sql_log_bin = DEFAULT, SESSION mysqlx_wait_timeout = DEFAULT",
+]
+
+# kind ("classic" or "dba"), host, port, user
+PoolKey = typing.Tuple[str, str, int, str]
+
+
+class _IdleSession:
+    __slots__ = ("obj", "since")
+
+    def __init__(self, obj):
+        self.obj = obj
+        self.since = time.monotonic()
+
+
+class SessionPool:
+    """
+    Idle sessions per endpoint and account, so that connecting again to the
+    same instance reuses a session instead of opening a new connection.
+
+    Sessions are taken with acquire() and given back with release(), which
+    SessionWrap and DbaWrap do on exit. Sessions that are never released are
+    closed when garbage collected, as before. Sessions whose last use raised
+    an error or whose state can't be reset are closed instead of pooled.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle: typing.Dict[PoolKey, typing.List[_IdleSession]] = {}
+        # password last used to connect with each key
+        self.passwords: typing.Dict[PoolKey, str] = {}
+
+    @staticmethod
+    def _key(kind: str, target: dict) -> PoolKey:
+        return (kind, target.get("host", ""), int(target.get("port", 3306)),
+                target.get("user", ""))
+
+    @staticmethod
+    def _session(kind: str, obj) -> 'ClassicSession':
+        return obj.session if kind == "dba" else obj
+
+    def _close(self, kind: str, obj) -> None:
+        try:
+            self._session(kind, obj).close()
+        except Exception:
+            pass
+
+    def _usable(self, kind: str, idle: _IdleSession) -> bool:
+        now = time.monotonic()
+        if now - idle.since > k_session_idle_timeout:
+            return False
+        session = self._session(kind, idle.obj)
+        try:
+            if not session.is_open():
+                return False
+            if now - idle.since > k_session_validate_after:
+                session.run_sql("SELECT 1").fetch_one()
+        except Exception:
+            return False
+        return True
+
+    def _reset(self, kind: str, obj) -> bool:
+        session = self._session(kind, obj)
+        try:
+            for sql in k_session_reset_sql:
+                session.run_sql(sql)
+            # there's no way to unset the current schema
+            return session.run_sql("SELECT DATABASE()").fetch_one()[0] is None
+        except Exception:
+            return False
+
+    def acquire(self, kind: str, target: dict, connect: Callable[[dict], T]) -> T:
+        key = self._key(kind, target)
+        password = target.get("password", "")
+        stale = []
+        with self.lock:
+            if self.passwords.get(key) != password:
+                # credentials changed, sessions opened with the old ones go
+                stale = self.idle.pop(key, [])
+                self.passwords[key] = password
+        for idle in stale:
+            _pool_idle.dec(kind=kind)
+            self._close(kind, idle.obj)
+
+        while True:
+            with self.lock:
+                idle_list = self.idle.get(key)
+                idle = idle_list.pop() if idle_list else None
+            if not idle:
+                break
+            _pool_idle.dec(kind=kind)
+            if self._usable(kind, idle):
+                _pool_requests.inc(kind=kind, result="hit")
+                return idle.obj
+            self._close(kind, idle.obj)
+
+        _pool_requests.inc(kind=kind, result="miss")
+        return connect(target)
+
+    def release(self, kind: str, obj, reusable: bool = True) -> None:
+        key = None
+        if reusable and self._reset(kind, obj):
+            try:
+                co = mysqlsh.globals.shell.parse_uri(self._session(kind, obj).uri)
+                key = self._key(kind, co)
+            except Exception:
+                pass
+
+        with self.lock:
+            if key in self.passwords:
+                idle_list = self.idle.setdefault(key, [])
+                if len(idle_list) < k_session_pool_size:
+                    idle_list.append(_IdleSession(obj))
+                    _pool_idle.inc(kind=kind)
+                    obj = None
+            expired = self._take_expired()
+
+        if obj is not None:
+            self._close(kind, obj)
+        for idle_kind, idle in expired:
+            self._close(idle_kind, idle.obj)
+
+    def _take_expired(self) -> typing.List[typing.Tuple[str, _IdleSession]]:
+        expired = []
+        limit = time.monotonic() - k_session_idle_timeout
+        for key in list(self.idle):
+            keep = []
+            for idle in self.idle[key]:
+                if idle.since < limit:
+                    expired.append((key[0], idle))
+                    _pool_idle.dec(kind=key[0])
                 else:
-                    self.logger.error(
-                        f"Error executing {f.__qualname__}, giving up: {err}")
-                    raise
+                    keep.append(idle)
+            if keep:
+                self.idle[key] = keep
+            else:
+                del self.idle[key]
+        return expired
+
+
+g_session_pool = SessionPool()
 
 
 class SessionWrap:
-    def __init__(self, session: Union['ClassicSession', dict]) -> None:
+    def __init__(self, session: Union['ClassicSession', dict],
+                 pooled: bool = False) -> None:
+        # pooled sessions go back to g_session_pool on exit
+        self.pooled = pooled
         if isinstance(session, dict):
             try:
                 self.session = mysql.get_session(session)
@@ -136,7 +393,10 @@ class SessionWrap:
         return self.session
 
     def __exit__(self, exc_type, exc_value, traceback) -> None:
-        self.session.close()
+        if self.pooled:
+            g_session_pool.release("classic", self.session, exc_type is None)
+        else:
+            self.session.close()
 
     def __getattr__(self, name) -> Any:
         return getattr(self.session, name)
@@ -150,7 +410,7 @@ class DbaWrap:
         return self.dba
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.dba.session.close()
+        g_session_pool.release("dba", self.dba, exc_type is None)
 
     def __getattr__(self, name):
         return getattr(self.dba, name)
@@ -170,28 +430,148 @@ class ClusterWrap:
         return getattr(self.cluster, name)
 
 
+def pooled_connect_dba(target: dict) -> 'Dba':
+    """Connect without retrying, reusing an idle session if there is one"""
+    return g_session_pool.acquire("dba", target, mysqlsh.connect_dba)
+
+
 def connect_dba(target: dict, logger: Logger, **kwargs) -> 'Dba':
-    return RetryLoop(logger, **kwargs).call(mysqlsh.connect_dba, target)
+    return RetryLoop(logger, **kwargs).call(pooled_connect_dba, target)
+
+
+def _connect_session(target: dict) -> 'ClassicSession':
+    session = mysqlsh.mysql.get_session(target)
+    # These are run once per connection, pooled sessions keep them
+    # avoid trouble with global autocommit=0
+    session.run_sql("set autocommit=1")
+    # make sure there's no global ansi_quotes or anything like that
+    session.run_sql("set sql_mode=''")
+    try:
+        # avoid problems with GR consistency during queries, if GR is running
+        session.run_sql("set group_replication_consistency='EVENTUAL'")
+    except:
+        pass
+    return session
 
 
 def connect_to_pod(pod: MySQLPod, logger: Logger, **kwargs):
     def connect(target):
-        session = mysqlsh.mysql.get_session(target)
-        # avoid trouble with global autocommit=0
-        session.run_sql("set autocommit=1")
-        # make sure there's no global ansi_quotes or anything like that
-        session.run_sql("set sql_mode=''")
+        return SessionWrap(
+            g_session_pool.acquire("classic", target, _connect_session),
+            pooled=True)
+
+    return RetryLoop(logger, **kwargs).call(connect, pod.endpoint_co)
+
+
+# Max time an AdminAPI Cluster handle is kept unused (seconds)
+k_cluster_handle_idle_timeout = 300
+
+k_primary_member_query = ("SELECT member_id FROM performance_schema.replication_group_members"
+                          " WHERE member_role = 'PRIMARY'")
+
+_cluster_handle_requests = g_metrics.counter(
+    "mysql_operator_cluster_handle_requests_total",
+    "AdminAPI Cluster handles requested, by whether a cached one was reused")
+
+
+def query_primary_member_id(session: 'ClassicSession') -> Optional[str]:
+    row = session.run_sql(k_primary_member_query).fetch_one()
+    return row[0] if row else None
+
+
+class _ClusterHandle:
+    __slots__ = ("primary_id", "dba", "cluster", "since")
+
+    def __init__(self, primary_id: str, dba: 'Dba', cluster: 'Cluster'):
+        self.primary_id = primary_id
+        self.dba = dba
+        self.cluster = cluster
+        self.since = time.monotonic()
+
+
+class ClusterHandleCache:
+    """
+    AdminAPI Cluster handles (with the Dba they were obtained from) of each
+    InnoDB Cluster, keyed by cluster UID and the member id of the PRIMARY
+    they were obtained with. Getting a handle from dba.get_cluster() reads
+    the whole metadata and opens a session to the PRIMARY, so handles are
+    reused until the PRIMARY changes.
+
+    Handles are taken with get() and given back with put(), so that only one
+    thread uses a handle at a time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.handles: typing.Dict[str, _ClusterHandle] = {}
+
+    def get(self, uid: str, primary_id: Optional[str] = None
+            ) -> Optional[typing.Tuple['Dba', 'Cluster']]:
+        """
+        Take the cached handle of a cluster, if it still refers to the current
+        PRIMARY (primary_id, when given by the caller)
+        """
+        with self.lock:
+            handle = self.handles.pop(uid, None)
+        if handle and (time.monotonic() - handle.since > k_cluster_handle_idle_timeout
+                       or (primary_id and handle.primary_id != primary_id)):
+            self._close(handle.dba, handle.cluster)
+            handle = None
+        if handle:
+            try:
+                # the PRIMARY may have changed before the monitor noticed
+                if query_primary_member_id(handle.dba.session) != handle.primary_id:
+                    self._close(handle.dba, handle.cluster)
+                    handle = None
+            except mysqlsh.Error:
+                self._close(handle.dba, handle.cluster)
+                handle = None
+
+        _cluster_handle_requests.inc(result="hit" if handle else "miss")
+        if handle:
+            return handle.dba, handle.cluster
+        return None
+
+    def put(self, uid: str, dba: 'Dba', cluster: 'Cluster') -> None:
+        handle = None
+        try:
+            primary_id = query_primary_member_id(dba.session)
+            if primary_id:
+                handle = _ClusterHandle(primary_id, dba, cluster)
+        except mysqlsh.Error:
+            pass
+        if not handle:
+            self._close(dba, cluster)
+            return
+
+        with self.lock:
+            old = self.handles.pop(uid, None)
+            self.handles[uid] = handle
+        if old and old.dba is not dba:
+            self._close(old.dba, old.cluster)
+
+    def invalidate(self, uid: str) -> None:
+        with self.lock:
+            handle = self.handles.pop(uid, None)
+        if handle:
+            self._close(handle.dba, handle.cluster)
+
+    @staticmethod
+    def _close(dba: 'Dba', cluster: 'Cluster') -> None:
+        try:
+            cluster.disconnect()
+        except Exception:
+            pass
         try:
-            # avoid problems with GR consistency during queries, if GR is running
-            session.run_sql("set group_replication_consistency='EVENTUAL'")
-        except:
+            dba.session.close()
+        except Exception:
             pass
-        return SessionWrap(session)
 
-    return RetryLoop(logger, **kwargs).call(connect, pod.endpoint_co)
+
+g_cluster_handles = ClusterHandleCache()
 
 
-def jump_to_primary(session, account):
+def jump_to_primary(session, account, connect_timeout: Optional[int] = None):
     # Check if we're already the PRIMARY
     res = session.run_sql(
         "SELECT member_role, member_host, (member_host = cast(coalesce(@@report_host, @@hostname) as char ascii)) as me"
@@ -208,6 +588,8 @@ def jump_to_primary(session, account):
                 co = mysqlsh.globals.shell.parse_uri(session.uri)
                 co["user"], co["password"] = account
                 co["host"] = r[1]
+                if connect_timeout is not None:
+                    co["connect-timeout"] = connect_timeout
                 try:
                     return mysqlx.get_session(co)
                 except mysqlsh.Error as e:
@@ -231,7 +613,7 @@ def get_valid_cluster_handle(cluster, logger):
         for pod in cluster.get_pods():
             if pod.name not in ignore_pods:
                 try:
-                    dba = mysqlsh.connect_dba(pod.endpoint_co)
+                    dba = pooled_connect_dba(pod.endpoint_co)
                 except Exception as e:
                     logger.warning(
                         f"Could not connect: target={pod.endpoint} error={e}")
@@ -49,6 +49,11 @@ class EphemeralState:
         with self.lock:
             self.data[key] = value
 
+    def clear(self, obj, key: str) -> None:
+        key = obj.namespace+"/"+obj.name+"/"+key
+        with self.lock:
+            self.data.pop(key, None)
+
 
 g_ephemeral_pod_state = EphemeralState()
 
@@ -0,0 +1,369 @@
+# Copyright (c) 2020, 2021, Oracle and/or its affiliates.
+#
+# Licensed under the Universal Permissive License v 1.0 as shown at https://oss.oracle.com/licenses/upl/
+#
+
+# Minimal asyncio X Protocol client, used to receive Group Replication
+# notices without going through a shell session.
+#
+# Only what's needed to authenticate, subscribe to notices and run simple
+# statements that don't return rows is implemented. Messages are encoded and
+# decoded by hand, following the protobuf definitions in mysqlx_*.proto.
+
+import asyncio
+import hashlib
+import socket
+import ssl
+import struct
+from typing import Dict, List, Optional, Tuple
+
+
+# Client message types (Mysqlx.ClientMessages.Type)
+CON_CAPABILITIES_SET = 2
+CON_CLOSE = 3
+SESS_AUTHENTICATE_START = 4
+SESS_AUTHENTICATE_CONTINUE = 5
+SQL_STMT_EXECUTE = 12
+
+# Server message types (Mysqlx.ServerMessages.Type)
+OK = 0
+ERROR = 1
+SESS_AUTHENTICATE_CONTINUE_S = 3
+SESS_AUTHENTICATE_OK = 4
+NOTICE = 11
+SQL_STMT_EXECUTE_OK = 17
+
+# Mysqlx.Notice.Frame.Type
+NOTICE_GROUP_REPLICATION_STATE_CHANGED = 4
+
+# Mysqlx.Notice.GroupReplicationStateChanged.Type
+GR_MEMBERSHIP_QUORUM_LOSS = 1
+GR_MEMBERSHIP_VIEW_CHANGE = 2
+GR_MEMBER_ROLE_CHANGE = 3
+GR_MEMBER_STATE_CHANGE = 4
+
+# Notice names accepted by the enable_notices admin command
+NOTICE_GR_QUORUM_LOSS = "group_replication/membership/quorum_loss"
+NOTICE_GR_VIEW = "group_replication/membership/view"
+NOTICE_GR_ROLE_CHANGE = "group_replication/status/role_change"
+NOTICE_GR_STATE_CHANGE = "group_replication/status/state_change"
+
+# Mysqlx.Datatypes.Any.Type / Scalar.Type
+_ANY_SCALAR = 1
+_ANY_OBJECT = 2
+_ANY_ARRAY = 3
+_SCALAR_V_BOOL = 7
+_SCALAR_V_STRING = 8
+
+_MAX_FRAME_SIZE = 64 * 1024 * 1024
+
+
+class XProtocolError(Exception):
+    def __init__(self, code: int, msg: str):
+        super().__init__(f"{msg} ({code})")
+        self.code = code
+        self.msg = msg
+
+
+class GRNotice:
+    def __init__(self, type: int, view_id: str):
+        self.type = type
+        self.view_id = view_id
+
+    def __repr__(self) -> str:
+        return f"<GRNotice type={self.type} view_id={self.view_id}>"
+
+
+#
+# Protobuf wire format helpers
+#
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        b = value & 0x7f
+        value >>= 7
+        if value:
+            out.append(b | 0x80)
+        else:
+            out.append(b)
+            return bytes(out)
+
+
+def _field_varint(num: int, value: int) -> bytes:
+    return _varint(num << 3) + _varint(value)
+
+
+def _field_bytes(num: int, value: bytes) -> bytes:
+    return _varint((num << 3) | 2) + _varint(len(value)) + value
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        value |= (b & 0x7f) << shift
+        if not b & 0x80:
+            return value, pos
+        shift += 7
+
+
+def decode_message(data: bytes) -> Dict[int, list]:
+    """
+    Decode a protobuf message into a dict of field number -> list of values.
+    Varints are returned as int, length delimited fields as bytes.
+    """
+    fields: Dict[int, list] = {}
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        num, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value = data[pos:pos+length]
+            pos += length
+        elif wire_type == 1:
+            value = data[pos:pos+8]
+            pos += 8
+        elif wire_type == 5:
+            value = data[pos:pos+4]
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        fields.setdefault(num, []).append(value)
+    return fields
+
+
+def _first(fields: Dict[int, list], num: int, default=None):
+    values = fields.get(num)
+    return values[0] if values else default
+
+
+def _any_bool(value: bool) -> bytes:
+    scalar = _field_varint(1, _SCALAR_V_BOOL) + _field_varint(8, int(value))
+    return _field_varint(1, _ANY_SCALAR) + _field_bytes(2, scalar)
+
+
+def _any_string(value: str) -> bytes:
+    string = _field_bytes(1, value.encode("utf8"))
+    scalar = _field_varint(1, _SCALAR_V_STRING) + _field_bytes(9, string)
+    return _field_varint(1, _ANY_SCALAR) + _field_bytes(2, scalar)
+
+
+def _any_array(values: List[bytes]) -> bytes:
+    array = b"".join(_field_bytes(1, v) for v in values)
+    return _field_varint(1, _ANY_ARRAY) + _field_bytes(4, array)
+
+
+def _any_object(fields: Dict[str, bytes]) -> bytes:
+    obj = b"".join(_field_bytes(1, _field_bytes(1, k.encode("utf8")) + _field_bytes(2, v))
+                   for k, v in fields.items())
+    return _field_varint(1, _ANY_OBJECT) + _field_bytes(3, obj)
+
+
+def decode_notice(payload: bytes) -> Optional[GRNotice]:
+    """
+    Decode a Mysqlx.Notice.Frame, returning None if it's not a GR notice.
+    """
+    frame = decode_message(payload)
+    if _first(frame, 1) != NOTICE_GROUP_REPLICATION_STATE_CHANGED:
+        return None
+    change = decode_message(_first(frame, 3, b""))
+    return GRNotice(_first(change, 1, 0),
+                    _first(change, 2, b"").decode("utf8"))
+
+
+def _decode_error(payload: bytes) -> XProtocolError:
+    fields = decode_message(payload)
+    return XProtocolError(_first(fields, 2, 0),
+                          _first(fields, 3, b"").decode("utf8", "replace"))
+
+
+class _FrameReader(asyncio.Protocol):
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.frames: asyncio.Queue = asyncio.Queue()
+        self.transport: Optional[asyncio.Transport] = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        self.buffer += data
+        while len(self.buffer) >= 4:
+            size = struct.unpack_from("<I", self.buffer)[0]
+            if size < 1 or size > _MAX_FRAME_SIZE:
+                self.frames.put_nowait(
+                    ConnectionError(f"Invalid X Protocol frame size {size}"))
+                self.transport.close()
+                return
+            if len(self.buffer) < 4 + size:
+                break
+            mtype = self.buffer[4]
+            payload = bytes(self.buffer[5:4+size])
+            del self.buffer[:4+size]
+            self.frames.put_nowait((mtype, payload))
+
+    def connection_lost(self, exc) -> None:
+        self.frames.put_nowait(
+            exc or ConnectionError("Connection closed by server"))
+
+
+class XNoticeConnection:
+    """
+    X Protocol connection that only listens to server notices.
+
+    Notices are decoded as soon as they arrive on the socket, so they can be
+    processed without executing any statements.
+    """
+
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.transport: Optional[asyncio.Transport] = None
+        self.reader: Optional[_FrameReader] = None
+        self.notices: List[GRNotice] = []
+
+    def __str__(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    @classmethod
+    async def connect(cls, host: str, port: int, user: str, password: str,
+                      timeout: float) -> 'XNoticeConnection':
+        conn = cls(host, port)
+        try:
+            await asyncio.wait_for(conn._open(user, password), timeout)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def _open(self, user: str, password: str) -> None:
+        loop = asyncio.get_running_loop()
+        self.transport, self.reader = await loop.create_connection(
+            _FrameReader, self.host, self.port)
+        sock = self.transport.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        if await self._start_tls():
+            await self._authenticate("PLAIN", f"\0{user}\0{password}".encode("utf8"))
+        else:
+            # PLAIN needs TLS, fall back to challenge-response, which works
+            # as long as the server has the account in its auth cache
+            await self._authenticate("SHA256_MEMORY", None, user, password)
+
+    async def _start_tls(self) -> bool:
+        capability = _field_bytes(1, b"tls") + _field_bytes(2, _any_bool(True))
+        self._send(CON_CAPABILITIES_SET,
+                   _field_bytes(1, _field_bytes(1, capability)))
+        try:
+            await self._read_reply(OK)
+        except XProtocolError:
+            return False
+
+        # certificates are not verified, same as ssl-mode=REQUIRED
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+
+        loop = asyncio.get_running_loop()
+        self.transport = await loop.start_tls(self.transport, self.reader, context)
+        self.reader.transport = self.transport
+        return True
+
+    async def _authenticate(self, mech: str, auth_data: Optional[bytes],
+                            user: str = "", password: str = "") -> None:
+        start = _field_bytes(1, mech.encode("ascii"))
+        if auth_data is not None:
+            start += _field_bytes(2, auth_data)
+        self._send(SESS_AUTHENTICATE_START, start)
+
+        mtype, payload = await self._read_reply(SESS_AUTHENTICATE_OK,
+                                                SESS_AUTHENTICATE_CONTINUE_S)
+        if mtype == SESS_AUTHENTICATE_CONTINUE_S:
+            nonce = _first(decode_message(payload), 1, b"")
+            hash1 = hashlib.sha256(password.encode("utf8")).digest()
+            hash2 = hashlib.sha256(hashlib.sha256(hash1).digest() + nonce).digest()
+            scramble = bytes(a ^ b for a, b in zip(hash1, hash2))
+            response = f"\0{user}\0{scramble.hex().upper()}".encode("utf8")
+            self._send(SESS_AUTHENTICATE_CONTINUE, _field_bytes(1, response))
+            await self._read_reply(SESS_AUTHENTICATE_OK)
+
+    def _send(self, mtype: int, payload: bytes) -> None:
+        if not self.transport or self.transport.is_closing():
+            raise ConnectionError(f"Connection to {self} is closed")
+        self.transport.write(struct.pack("<IB", len(payload) + 1, mtype) + payload)
+
+    async def _read_frame(self) -> Tuple[int, bytes]:
+        frame = await self.reader.frames.get()
+        if isinstance(frame, BaseException):
+            # keep the error around for anyone else waiting on the connection
+            self.reader.frames.put_nowait(frame)
+            raise frame
+        return frame
+
+    async def _read_reply(self, *expected: int) -> Tuple[int, bytes]:
+        """
+        Read frames until one of the expected types arrives. Notices received
+        in the meantime are queued to be returned by read_notice().
+        """
+        while True:
+            mtype, payload = await self._read_frame()
+            if mtype in expected:
+                return mtype, payload
+            if mtype == ERROR:
+                raise _decode_error(payload)
+            if mtype == NOTICE:
+                notice = decode_notice(payload)
+                if notice:
+                    self.notices.append(notice)
+            # anything else (e.g. resultset frames) is ignored
+
+    async def execute(self, stmt: str, namespace: str = "sql",
+                      args: Optional[List[bytes]] = None) -> None:
+        """
+        Execute a statement and wait for it to finish. Any rows it returns are
+        discarded.
+        """
+        payload = _field_bytes(1, stmt.encode("utf8"))
+        for arg in args or []:
+            payload += _field_bytes(2, arg)
+        payload += _field_bytes(3, namespace.encode("ascii"))
+        self._send(SQL_STMT_EXECUTE, payload)
+        await self._read_reply(SQL_STMT_EXECUTE_OK)
+
+    async def ping(self) -> None:
+        await self.execute("ping", namespace="mysqlx")
+
+    async def enable_notices(self, notices: List[str]) -> None:
+        arg = _any_object({"notice": _any_array([_any_string(n) for n in notices])})
+        await self.execute("enable_notices", namespace="mysqlx", args=[arg])
+
+    async def read_notice(self) -> GRNotice:
+        """
+        Wait for the next GR notice. Raises an exception if the connection
+        is lost.
+        """
+        while not self.notices:
+            mtype, payload = await self._read_frame()
+            if mtype == NOTICE:
+                notice = decode_notice(payload)
+                if notice:
+                    self.notices.append(notice)
+            elif mtype == ERROR:
+                raise _decode_error(payload)
+        return self.notices.pop(0)
+
+    def close(self) -> None:
+        if self.transport and not self.transport.is_closing():
+            try:
+                self._send(CON_CLOSE, b"")
+            except ConnectionError:
+                pass
+            self.transport.close()
+        self.transport = None
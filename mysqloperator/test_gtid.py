@@ -0,0 +1,98 @@
+import pytest
+import time
+from .controller.gtid import GtidSet
+
+U1 = "3e11fa47-71ca-11e1-9e33-c80aa9429562"
+U2 = "8d1f7d58-71ca-11e1-9e33-c80aa9429562"
+
+
+def count_gtids_str(gtid_set: str) -> int:
+    # the string based implementation GtidSet replaced, for the benchmark
+    def count_range(r):
+        begin, _, end = r.partition("-")
+        if not end:
+            return 1
+        else:
+            return int(end)-int(begin)+1
+    n = 0
+    for g in gtid_set.replace("\n", "").split(","):
+        for r in g.split(":")[1:]:
+            n += count_range(r)
+    return n
+
+
+def test_gtid_set_parse() -> None:
+    s = GtidSet.parse(f"{U2}:5-7:1-3,\n{U1}:10:11:4-6")
+    assert str(s) == f"{U1}:4-6:10-11,\n{U2}:1-3:5-7"
+    assert s.count() == 11
+
+    assert not GtidSet.parse("")
+    assert not GtidSet.parse(None)
+    assert GtidSet.parse(U1.upper() + ":1") == GtidSet.parse(U1 + ":1")
+
+    with pytest.raises(ValueError):
+        GtidSet.parse(U1)
+    with pytest.raises(ValueError):
+        GtidSet.parse(f"{U1}:5-3")
+
+
+def test_gtid_set_union() -> None:
+    a = GtidSet.parse(f"{U1}:1-5:10")
+    b = GtidSet.parse(f"{U1}:6-9,{U2}:1")
+    assert str(a | b) == f"{U1}:1-10,\n{U2}:1"
+    assert (a | b).count() == 11
+
+
+def test_gtid_set_subtract() -> None:
+    a = GtidSet.parse(f"{U1}:1-10:20-30,{U2}:1-5")
+    b = GtidSet.parse(f"{U1}:3-4:8-22:30,{U2}:1-5")
+    assert str(a - b) == f"{U1}:1-2:5-7:23-29"
+    assert not (b - (a | b))
+    assert a - GtidSet() == a
+
+
+def test_gtid_set_contains() -> None:
+    a = GtidSet.parse(f"{U1}:1-10:20-30,{U2}:1-5")
+    assert a.contains(GtidSet.parse(f"{U1}:2-3:25"))
+    assert a.contains(GtidSet())
+    assert not a.contains(GtidSet.parse(f"{U1}:10-11"))
+    assert not a.contains(GtidSet.parse(f"{U1}:15"))
+    assert not a.contains(GtidSet.parse(f"{U2}:6"))
+    assert not GtidSet().contains(a)
+
+
+def test_gtid_set_count_matches_string_count() -> None:
+    s = f"{U1}:1-100:200:300-400,\n{U2}:1-5"
+    assert GtidSet.parse(s).count() == count_gtids_str(s)
+
+
+def benchmark(n: int = 10000) -> None:
+    # Counting GTID sets that are already parsed vs re-parsing the string
+    # every time, as done when sorting pods by number of transactions
+    s = ",\n".join(f"{i:08x}-71ca-11e1-9e33-c80aa9429562:1-1000:" +
+                   ":".join(f"{j*10}-{j*10+5}" for j in range(101, 150))
+                   for i in range(8))
+    parsed = GtidSet.parse(s)
+
+    start = time.perf_counter()
+    for _ in range(n):
+        count_gtids_str(s)
+    t_str = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n):
+        parsed.count()
+    t_set = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(n // 10):
+        GtidSet.parse(s)
+    t_parse = (time.perf_counter() - start) * 10
+
+    print(f"count string:  {t_str/n*1e6:.2f} us/op")
+    print(f"count GtidSet: {t_set/n*1e6:.2f} us/op")
+    print(f"parse GtidSet: {t_parse/n*1e6:.2f} us/op")
+
+
+if __name__ == "__main__":
+    benchmark()
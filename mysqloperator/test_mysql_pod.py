@@ -0,0 +1,126 @@
+import pytest
+import json
+import time
+from kubernetes import client
+from .controller.kubeutils import api_core
+from .controller.innodbcluster.cluster_api import MySQLPod
+
+
+class _Response:
+    # what ApiClient.deserialize() expects
+    def __init__(self, data):
+        self.data = json.dumps(data)
+
+
+def make_pod_body() -> dict:
+    return {
+        "apiVersion": "v1",
+        "kind": "Pod",
+        "metadata": {
+            "name": "mycluster-1",
+            "namespace": "default",
+            "uid": "6a4bd0e3-3f36-4a7b-9d0c-1b3b3a29d3f1",
+            "resourceVersion": "1234",
+            "labels": {"component": "mysqld",
+                       "mysql.oracle.com/cluster": "mycluster"},
+            "annotations": {
+                "mysql.oracle.com/membership-info": json.dumps({
+                    "memberId": "3e11fa47-71ca-11e1-9e33-c80aa9429562",
+                    "role": "SECONDARY",
+                    "status": "ONLINE",
+                    "groupViewId": "16378:3"})
+            },
+            "ownerReferences": [{"apiVersion": "apps/v1", "kind": "StatefulSet",
+                                 "name": "mycluster", "uid": "x"}]
+        },
+        "spec": {"subdomain": "mycluster-instances",
+                 "containers": [{"name": "sidecar"}, {"name": "mysql"}]},
+        "status": {
+            "phase": "Running",
+            "podIP": "10.0.0.12",
+            "conditions": [{"type": "ContainersReady", "status": "True"},
+                           {"type": "mysql.oracle.com/ready", "status": "False"}],
+            "containerStatuses": [
+                {"name": "mysql", "ready": True, "restartCount": 2,
+                 "image": "mysql/mysql-server:8.0.27",
+                 "imageID": "docker-pullable://mysql/mysql-server@sha256:0a1b2c",
+                 "containerID": "containerd://4f1d2c"},
+                {"name": "sidecar", "ready": True, "restartCount": 0,
+                 "image": "mysql/mysql-operator:8.0.27",
+                 "imageID": "docker-pullable://mysql/mysql-operator@sha256:3d4e5f",
+                 "containerID": "containerd://8a9b0c"}]
+        }
+    }
+
+
+@pytest.fixture
+def pod_body() -> dict:
+    return make_pod_body()
+
+
+def test_mysql_pod_fields(pod_body) -> None:
+    pod = MySQLPod.from_json(pod_body)
+    assert pod.name == "mycluster-1"
+    assert pod.index == 1
+    assert pod.cluster_name == "mycluster"
+    assert pod.address_fqdn == "mycluster-1.mycluster-instances.default.svc.cluster.local"
+    assert pod.pod_ip_address == "10.0.0.12"
+    assert pod.phase == "Running"
+    assert not pod.deleting
+    assert pod.check_containers_ready()
+    assert pod.get_member_readiness_gate("ready") is False
+    assert pod.check_condition("PodScheduled") is None
+    assert pod.get_container_restarts("mysql") == 2
+    assert pod.owner_reference("apps/v1", "StatefulSet")["name"] == "mycluster"
+    assert pod.self_ref()["resourceVersion"] == "1234"
+
+
+def test_mysql_pod_from_model(pod_body) -> None:
+    v1pod = api_core.api_client.deserialize(_Response(pod_body), client.V1Pod)
+    pod = MySQLPod(v1pod)
+    assert pod.name == "mycluster-1"
+    assert pod.get_container_restarts("mysql") == 2
+
+
+def test_mysql_pod_membership_info(pod_body) -> None:
+    pod = MySQLPod.from_json(pod_body)
+    assert pod.get_membership_info("role") == "SECONDARY"
+
+    # callers may modify the returned info
+    info = pod.get_membership_info()
+    info["role"] = "PRIMARY"
+    assert pod.get_membership_info("role") == "SECONDARY"
+
+    pod_body["metadata"]["annotations"]["mysql.oracle.com/membership-info"] = \
+        json.dumps({"role": "PRIMARY"})
+    pod_body["metadata"]["resourceVersion"] = "1235"
+    assert MySQLPod.from_json(pod_body).get_membership_info("role") == "PRIMARY"
+
+
+def benchmark(pod_body: dict, n: int = 10000) -> None:
+    # What the pod event handler reads from each event, with the pod view
+    # vs deserializing a V1Pod as it was done before
+    def handle(pod):
+        pod.get_membership_info()
+        pod.check_containers_ready()
+        pod.get_container_restarts("mysql")
+        return pod.phase, pod.deleting, pod.name
+
+    start = time.perf_counter()
+    for _ in range(n // 10):
+        v1pod = api_core.api_client.deserialize(_Response(pod_body), client.V1Pod)
+        v1pod.metadata.annotations and json.loads(
+            v1pod.metadata.annotations["mysql.oracle.com/membership-info"])
+    t_model = (time.perf_counter() - start) * 10
+
+    start = time.perf_counter()
+    for _ in range(n):
+        handle(MySQLPod.from_json(pod_body))
+    t_view = time.perf_counter() - start
+
+    print(f"V1Pod deserialization: {t_model/n*1e6:.2f} us/event")
+    print(f"MySQLPod view:         {t_view/n*1e6:.2f} us/event")
+
+
+if __name__ == "__main__":
+    benchmark(make_pod_body())
@@ -0,0 +1,45 @@
+import threading
+import time
+from .controller.requeue import RequeueScheduler
+
+
+def test_requeue_runs_after_delay() -> None:
+    scheduler = RequeueScheduler()
+    done = threading.Event()
+    start = time.monotonic()
+    scheduler.schedule("a", 0.2, done.set)
+    assert scheduler.pending("a")
+    assert done.wait(2)
+    assert time.monotonic() - start >= 0.2
+    assert not scheduler.pending("a")
+    scheduler.stop()
+
+
+def test_requeue_keeps_one_retry_per_key() -> None:
+    scheduler = RequeueScheduler()
+    calls = []
+    done = threading.Event()
+
+    def call(n):
+        calls.append(n)
+        done.set()
+
+    scheduler.schedule("a", 0.5, lambda: call(1))
+    # earliest time wins, latest function runs
+    scheduler.schedule("a", 0.1, lambda: call(2))
+    scheduler.schedule("a", 1, lambda: call(3))
+    assert done.wait(2)
+    time.sleep(0.6)
+    assert calls == [3]
+    scheduler.stop()
+
+
+def test_requeue_cancel() -> None:
+    scheduler = RequeueScheduler()
+    calls = []
+    scheduler.schedule("a", 0.1, lambda: calls.append("a"))
+    scheduler.schedule("b", 0.2, lambda: calls.append("b"))
+    scheduler.cancel("a")
+    time.sleep(0.5)
+    assert calls == ["b"]
+    scheduler.stop()
@@ -0,0 +1,110 @@
+import asyncio
+import struct
+import pytest
+from .controller import xprotocol
+from .controller.xprotocol import (_FrameReader, XNoticeConnection, XProtocolError,
+                                   _any_bool, _field_bytes, _field_varint,
+                                   _read_varint, _varint, decode_message,
+                                   decode_notice)
+
+
+class _Transport:
+    def __init__(self):
+        self.written = b""
+
+    def write(self, data: bytes) -> None:
+        self.written += data
+
+    def is_closing(self) -> bool:
+        return False
+
+    def close(self) -> None:
+        pass
+
+
+def frame(mtype: int, payload: bytes) -> bytes:
+    return struct.pack("<IB", len(payload) + 1, mtype) + payload
+
+
+def gr_notice_frame(change_type: int, view_id: str) -> bytes:
+    change = _field_varint(1, change_type) + _field_bytes(2, view_id.encode("utf8"))
+    notice = (_field_varint(1, xprotocol.NOTICE_GROUP_REPLICATION_STATE_CHANGED)
+              + _field_varint(2, 2)  # scope GLOBAL
+              + _field_bytes(3, change))
+    return frame(xprotocol.NOTICE, notice)
+
+
+@pytest.mark.parametrize("value", [0, 1, 127, 128, 300, 2**32 + 5])
+def test_varint_roundtrip(value) -> None:
+    data = _varint(value)
+    assert _read_varint(data + b"\xff", 0) == (value, len(data))
+
+
+def test_capabilities_set_roundtrip() -> None:
+    async def run():
+        conn = XNoticeConnection("localhost", 33060)
+        conn.transport = _Transport()
+        capability = _field_bytes(1, b"tls") + _field_bytes(2, _any_bool(True))
+        conn._send(xprotocol.CON_CAPABILITIES_SET,
+                   _field_bytes(1, _field_bytes(1, capability)))
+
+        reader = _FrameReader()
+        reader.data_received(conn.transport.written)
+        return await reader.frames.get()
+
+    mtype, payload = asyncio.run(run())
+    assert mtype == xprotocol.CON_CAPABILITIES_SET
+
+    capabilities = decode_message(payload)[1][0]
+    capability = decode_message(decode_message(capabilities)[1][0])
+    assert capability[1] == [b"tls"]
+    value = decode_message(capability[2][0])
+    assert value[1] == [1]  # Any.SCALAR
+    scalar = decode_message(value[2][0])
+    assert scalar[1] == [7] and scalar[8] == [1]  # V_BOOL true
+
+
+def test_decode_gr_notice() -> None:
+    payload = gr_notice_frame(xprotocol.GR_MEMBER_ROLE_CHANGE, "16378:3")[5:]
+    notice = decode_notice(payload)
+    assert notice.type == xprotocol.GR_MEMBER_ROLE_CHANGE
+    assert notice.view_id == "16378:3"
+
+    # other notices (e.g. SessionStateChanged) are ignored
+    assert decode_notice(_field_varint(1, 3) + _field_bytes(3, b"")) is None
+
+
+def test_error_reply() -> None:
+    error = (_field_varint(1, 1) + _field_varint(2, 1045)
+             + _field_bytes(3, b"Access denied") + _field_bytes(4, b"28000"))
+
+    async def run():
+        conn = XNoticeConnection("localhost", 33060)
+        conn.reader = _FrameReader()
+        conn.reader.data_received(frame(xprotocol.ERROR, error))
+        await conn._read_reply(xprotocol.OK)
+
+    with pytest.raises(XProtocolError) as e:
+        asyncio.run(run())
+    assert e.value.code == 1045
+    assert e.value.msg == "Access denied"
+
+
+def test_frame_split_across_reads() -> None:
+    data = (gr_notice_frame(xprotocol.GR_MEMBERSHIP_VIEW_CHANGE, "16378:4")
+            + gr_notice_frame(xprotocol.GR_MEMBER_STATE_CHANGE, "16378:4"))
+
+    async def run():
+        conn = XNoticeConnection("localhost", 33060)
+        conn.reader = _FrameReader()
+        # the first read ends in the middle of the header of the second frame
+        split = len(data) // 2 + 2
+        conn.reader.data_received(data[:split])
+        first = await conn.read_notice()
+        assert conn.reader.frames.empty()
+        conn.reader.data_received(data[split:])
+        return first, await conn.read_notice()
+
+    first, second = asyncio.run(run())
+    assert (first.type, first.view_id) == (xprotocol.GR_MEMBERSHIP_VIEW_CHANGE, "16378:4")
+    assert (second.type, second.view_id) == (xprotocol.GR_MEMBER_STATE_CHANGE, "16378:4")